@@ -0,0 +1,422 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+from recipes import cache
+from users import authentication
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+UNMATCHED_VIEW = '<unmatched>'
+EXITED_FILE = 'exited.json'
+LOCK_FILE = '.lock'
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+                           2.5, 5, 10)
+CACHES = {
+    'recipes': cache.stats,
+    'auth_token': authentication.stats,
+}
+
+
+def get_directory():
+    return Path(settings.METRICS_DIR)
+
+
+def get_buckets():
+    return tuple(getattr(
+        settings, 'METRICS_LATENCY_BUCKETS', DEFAULT_LATENCY_BUCKETS
+    ))
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    '''
+    Метрики процесса. Каждый процесс (воркер gunicorn) периодически
+    записывает свои значения в отдельный файл каталога METRICS_DIR,
+    эндпоинт /metrics суммирует файлы всех процессов.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.started = time.time()
+        self.flushed = 0
+        self.requests = Counter()
+        self.latency = {}
+        self.queries = Counter()
+        self.query_seconds = Counter()
+
+    def get_path(self):
+        # Время запуска в имени: воркер с повторно занятым pid
+        # не перезапишет значения завершившегося.
+        return get_directory() / f'{self.pid}-{int(self.started * 1000)}.json'
+
+    def observe(self, view, method, status, duration, queries, query_time):
+        with self.lock:
+            if self.pid != os.getpid():
+                # Значения, унаследованные от главного процесса при fork.
+                self.reset()
+            self.requests[view, method, status] += 1
+            buckets = get_buckets()
+            counts, total = self.latency.get(
+                (view, method), ([0] * (len(buckets) + 1), 0)
+            )
+            counts[bisect_left(buckets, duration)] += 1
+            self.latency[view, method] = counts, total + duration
+            self.queries[view] += queries
+            self.query_seconds[view] += query_time
+        if time.monotonic() - self.flushed >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def dump(self):
+        with self.lock:
+            return {
+                'pid': self.pid,
+                'ppid': os.getppid(),
+                'started': self.started,
+                'buckets': get_buckets(),
+                'requests': [
+                    [*labels, count]
+                    for labels, count in self.requests.items()
+                ],
+                'latency': [
+                    [*labels, counts, total]
+                    for labels, (counts, total) in self.latency.items()
+                ],
+                'queries': [
+                    [view, count, self.query_seconds[view]]
+                    for view, count in self.queries.items()
+                ],
+                'caches': {
+                    name: dict(stats) for name, stats in CACHES.items()
+                },
+            }
+
+    def flush(self):
+        '''Атомарная запись значений процесса в его файл.'''
+        self.flushed = time.monotonic()
+        path = self.get_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_file(path, self.dump())
+
+
+registry = Registry()
+
+
+def read_file(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def write_file(path, data):
+    '''Атомарная запись: читатели не увидят файл наполовину.'''
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps(data))
+    os.replace(temporary, path)
+
+
+def read_workers():
+    return [
+        worker for worker in map(
+            read_file, sorted(get_directory().glob('*.json'))
+        ) if worker is not None
+    ]
+
+
+def merge(workers):
+    '''
+    Сумма значений процессов в формате файла процесса. Гистограммы
+    с другими границами (до изменения настройки) не учитываются.
+    '''
+    buckets = get_buckets()
+    requests = Counter()
+    latency = {}
+    queries = Counter()
+    seconds = Counter()
+    caches = {}
+    for worker in workers:
+        for view, method, status, count in worker['requests']:
+            requests[view, method, status] += count
+        if tuple(worker['buckets']) == buckets:
+            for view, method, counts, total in worker['latency']:
+                summed, summed_total = latency.get(
+                    (view, method), ([0] * len(counts), 0)
+                )
+                latency[view, method] = (
+                    [a + b for a, b in zip(summed, counts)],
+                    summed_total + total
+                )
+        for view, count, query_time in worker['queries']:
+            queries[view] += count
+            seconds[view] += query_time
+        for name, values in worker['caches'].items():
+            caches.setdefault(name, Counter()).update(values)
+    return {
+        'pid': None,
+        'ppid': None,
+        'started': None,
+        'buckets': buckets,
+        'requests': [
+            [*labels, count] for labels, count in sorted(requests.items())
+        ],
+        'latency': [
+            [*labels, counts, total]
+            for labels, (counts, total) in sorted(latency.items())
+        ],
+        'queries': [
+            [view, count, seconds[view]]
+            for view, count in sorted(queries.items())
+        ],
+        'caches': {
+            name: dict(values) for name, values in sorted(caches.items())
+        },
+    }
+
+
+def compact():
+    '''
+    Перенос значений завершившихся процессов в общий файл EXITED_FILE
+    и удаление их файлов. Имена перенесённых файлов сохраняются в общем
+    файле: если процесс прервётся до удаления, они будут удалены при
+    следующем вызове без повторного учёта.
+    '''
+    directory = get_directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / LOCK_FILE, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        exited_path = directory / EXITED_FILE
+        exited = read_file(exited_path)
+        for name in exited['compacted'] if exited else ():
+            (directory / name).unlink(missing_ok=True)
+        paths = [
+            path for path in directory.glob('*.json')
+            if path.name != EXITED_FILE
+            and not is_alive(int(path.stem.split('-')[0]))
+        ]
+        if not paths:
+            return
+        workers = [
+            worker for worker in map(read_file, paths) if worker is not None
+        ]
+        write_file(exited_path, {
+            **merge(workers + ([exited] if exited else [])),
+            'compacted': [path.name for path in paths],
+        })
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n'
+    )
+
+
+def format_labels(**labels):
+    return '{' + ','.join(
+        f'{name}="{escape(value)}"' for name, value in labels.items()
+    ) + '}'
+
+
+def format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def get_hit_ratio(stats):
+    total = stats['hits'] + stats['misses']
+    return stats['hits'] / total if total else 0
+
+
+class Collector:
+    '''Сумма значений всех процессов в текстовом формате Prometheus.'''
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.total = merge(workers)
+        self.lines = []
+
+    def metric(self, name, metric_type, help_text, samples):
+        self.lines.append(f'# HELP {name} {help_text}')
+        self.lines.append(f'# TYPE {name} {metric_type}')
+        for suffix, labels, value in samples:
+            self.lines.append(
+                f'{name}{suffix}{format_labels(**labels)} '
+                f'{format_number(value)}'
+            )
+
+    def collect_requests(self):
+        self.metric(
+            'foodgram_http_requests_total', 'counter',
+            'Количество запросов по представлениям и кодам ответа',
+            (('', dict(view=view, method=method, status=status), count)
+             for view, method, status, count in self.total['requests'])
+        )
+
+    def collect_latency(self):
+        buckets = (*self.total['buckets'], float('inf'))
+        samples = []
+        for view, method, counts, total in self.total['latency']:
+            cumulative = 0
+            for bound, count in zip(buckets, counts):
+                cumulative += count
+                samples.append(('_bucket', dict(
+                    view=view, method=method, le=format_number(bound)
+                ), cumulative))
+            labels = dict(view=view, method=method)
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, cumulative))
+        self.metric(
+            'foodgram_http_request_duration_seconds', 'histogram',
+            'Время обработки запросов', samples
+        )
+
+    def collect_queries(self):
+        self.metric(
+            'foodgram_db_queries_total', 'counter',
+            'Количество запросов к базе данных',
+            (('', dict(view=view), count)
+             for view, count, _ in self.total['queries'])
+        )
+        self.metric(
+            'foodgram_db_query_duration_seconds_total', 'counter',
+            'Суммарное время запросов к базе данных',
+            (('', dict(view=view), total)
+             for view, _, total in self.total['queries'])
+        )
+
+    def collect_caches(self):
+        stats = {
+            name: {'hits': 0, 'misses': 0, **self.total['caches'].get(
+                name, {}
+            )} for name in sorted({*CACHES, *self.total['caches']})
+        }
+        for result in ('hits', 'misses'):
+            self.metric(
+                f'foodgram_cache_{result}_total', 'counter',
+                'Попадания в кэш' if result == 'hits' else 'Промахи кэша',
+                (('', dict(cache=name), values[result])
+                 for name, values in stats.items())
+            )
+        self.metric(
+            'foodgram_cache_hit_ratio', 'gauge',
+            'Доля попаданий в кэш',
+            (('', dict(cache=name), get_hit_ratio(values))
+             for name, values in stats.items())
+        )
+
+    def collect_workers(self):
+        '''Работающие процессы: завершившиеся учитываются только в суммах.'''
+        workers = [
+            worker for worker in self.workers
+            if worker['pid'] is not None and is_alive(worker['pid'])
+        ]
+        self.metric(
+            'foodgram_worker_info', 'gauge',
+            'Работающие процессы приложения (воркеры gunicorn)',
+            (('', dict(pid=worker['pid'], ppid=worker['ppid']), 1)
+             for worker in workers)
+        )
+        self.metric(
+            'foodgram_worker_start_time_seconds', 'gauge',
+            'Время запуска процесса',
+            (('', dict(pid=worker['pid']), worker['started'])
+             for worker in workers)
+        )
+        self.metric(
+            'foodgram_worker_requests_total', 'counter',
+            'Количество запросов, обработанных процессом',
+            (('', dict(pid=worker['pid']), sum(
+                request[-1] for request in worker['requests']
+            )) for worker in workers)
+        )
+
+    def render(self):
+        self.collect_requests()
+        self.collect_latency()
+        self.collect_queries()
+        self.collect_caches()
+        self.collect_workers()
+        return '\n'.join(self.lines) + '\n'
+
+
+class QueryCounter:
+    '''Обёртка выполнения SQL для connection.execute_wrapper.'''
+
+    def __init__(self):
+        self.queries = 0
+        self.time = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - started
+            self.queries += 1
+
+
+class MetricsMiddleware:
+    '''
+    Учёт запросов для эндпоинта /metrics: количество по представлениям
+    и кодам ответа, время обработки и число запросов к базе.
+    Отключается настройкой METRICS_ENABLED.
+    '''
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        match = request.resolver_match
+        registry.observe(
+            match.view_name if match else UNMATCHED_VIEW,
+            request.method,
+            str(response.status_code),
+            time.perf_counter() - started,
+            counter.queries,
+            counter.time
+        )
+        return response
+
+
+def metrics(request):
+    '''Метрики всех процессов приложения в формате Prometheus.'''
+    if not getattr(settings, 'METRICS_ENABLED', True):
+        raise Http404
+    registry.flush()
+    compact()
+    return HttpResponse(
+        Collector(read_workers()).render(), content_type=CONTENT_TYPE
+    )
@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+
+import rest_framework
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework import serializers
+
+logger = logging.getLogger('foodgram.profiling')
+
+current_profile = ContextVar('current_profile', default=None)
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+MAX_DUPLICATES = 5
+MAX_SOURCE_DEPTH = 60
+REST_FRAMEWORK_DIR = os.path.dirname(rest_framework.__file__)
+
+
+def get_signature(sql):
+    '''SQL без значений: списки IN разной длины считаются одним запросом.'''
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+def get_source():
+    '''
+    Ближайший по стеку метод сериализатора проекта, выполнивший запрос.
+    Методы самого DRF пропускаются, если выше есть код проекта.
+    '''
+    frame = sys._getframe(2)
+    source = None
+    for _ in range(MAX_SOURCE_DEPTH):
+        if frame is None:
+            break
+        instance = frame.f_locals.get('self')
+        if isinstance(instance, serializers.Field):
+            name = f'{type(instance).__name__}.{frame.f_code.co_name}'
+            if not frame.f_code.co_filename.startswith(REST_FRAMEWORK_DIR):
+                return name
+            source = source or name
+        frame = frame.f_back
+    return source
+
+
+class Profile:
+    '''Замеры одного запроса.'''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0
+        self.signatures = defaultdict(Counter)
+        self.serializer_time = 0
+        self.serializer_depth = 0
+        self.render_started = None
+        self.render_time = 0
+
+    def execute(self, execute, sql, params, many, context):
+        '''Обёртка выполнения SQL для connection.execute_wrapper.'''
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.signatures[get_signature(sql)][get_source()] += 1
+
+    def start_render(self, response):
+        self.render_started = time.perf_counter()
+        response.add_post_render_callback(self.finish_render)
+
+    def finish_render(self, response):
+        self.render_time += time.perf_counter() - self.render_started
+
+    def get_duplicates(self, threshold):
+        '''
+        Повторяющиеся запросы (признак N+1): сигнатура, количество
+        и метод сериализатора, выполнивший большую часть повторов.
+        '''
+        duplicates = [
+            {
+                'sql': sql,
+                'count': sum(sources.values()),
+                'source': sources.most_common(1)[0][0],
+            }
+            for sql, sources in self.signatures.items()
+            if sum(sources.values()) >= threshold
+        ]
+        duplicates.sort(key=lambda duplicate: -duplicate['count'])
+        return duplicates[:MAX_DUPLICATES]
+
+
+def timed_serialization(get_data):
+    '''Учёт времени сериализации: вложенные вызовы не суммируются.'''
+    @wraps(get_data)
+    def wrapper(serializer):
+        profile = current_profile.get()
+        if profile is None or profile.serializer_depth:
+            return get_data(serializer)
+        profile.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return get_data(serializer)
+        finally:
+            profile.serializer_depth -= 1
+            profile.serializer_time += time.perf_counter() - started
+    wrapper.timed = True
+    return wrapper
+
+
+def install_serializer_timing():
+    for serializer_class in (serializers.Serializer,
+                             serializers.ListSerializer):
+        data = serializer_class.data
+        if not getattr(data.fget, 'timed', False):
+            serializer_class.data = property(timed_serialization(data.fget))
+
+
+class ProfilingMiddleware:
+    '''
+    Профилирование запросов: число и время запросов к базе, время
+    сериализации и отрисовки ответа. Результат передаётся в заголовке
+    Server-Timing и в журнал foodgram.profiling. Включается настройкой
+    PROFILING_ENABLED, доля профилируемых запросов задаётся
+    PROFILING_SAMPLE_RATE.
+    '''
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+        self.threshold = getattr(settings, 'PROFILING_DUPLICATE_THRESHOLD', 3)
+        install_serializer_timing()
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        profile = Profile()
+        request.profile = profile
+        token = current_profile.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        total = time.perf_counter() - profile.started
+        response['Server-Timing'] = self.get_server_timing(profile, total)
+        self.log(request, response, profile, total)
+        return response
+
+    def process_template_response(self, request, response):
+        profile = getattr(request, 'profile', None)
+        if profile is not None:
+            profile.start_render(response)
+        return response
+
+    @staticmethod
+    def get_server_timing(profile, total):
+        return ', '.join((
+            f'db;desc="{profile.queries} queries";'
+            f'dur={profile.db_time * 1000:.1f}',
+            f'serializer;dur={profile.serializer_time * 1000:.1f}',
+            f'render;dur={profile.render_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+    def log(self, request, response, profile, total):
+        match = request.resolver_match
+        duplicates = profile.get_duplicates(self.threshold)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': profile.queries,
+            'db_ms': round(profile.db_time * 1000, 1),
+            'serializer_ms': round(profile.serializer_time * 1000, 1),
+            'render_ms': round(profile.render_time * 1000, 1),
+            'total_ms': round(total * 1000, 1),
+            'duplicates': duplicates,
+        }
+        logger.log(
+            logging.WARNING if duplicates else logging.INFO,
+            json.dumps(record, ensure_ascii=False)
+        )
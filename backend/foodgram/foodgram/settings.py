@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -30,6 +31,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.metrics.MetricsMiddleware',
+    'foodgram.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,6 +73,78 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+RECIPES_CACHE_ENABLED = True
+RECIPES_CACHE_TIMEOUT = 300
+# Версии данных для ключей кэша и ETag хранятся в базе (DataVersion),
+# в кэше процесса — не дольше указанного числа секунд: изменения из других
+# воркеров и команд управления видны не позже чем через это время.
+RECIPES_VERSION_TIMEOUT = 5
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+IMAGE_VARIANTS = {
+    'card': (480, 480),
+    'detail': (960, 960),
+    'retina': (1920, 1920),
+}
+IMAGE_VARIANTS_QUALITY = 80
+# Потоки фоновых задач процесса: уменьшенные копии изображений,
+# удаление изображений без ссылок, заполнение лент подписок.
+TASK_WORKERS = int(os.getenv('TASK_WORKERS', '2'))
+TASKS_EAGER = False
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_UPLOAD_MAX_DIMENSION = 8000
+
+FEED_FANOUT_LIMIT = 1000
+
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '1.0'))
+PROFILING_DUPLICATE_THRESHOLD = 3
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+# Каталог файлов метрик, общий для воркеров одного экземпляра приложения.
+# Каждый процесс пишет файл {pid}-{время запуска}.json, при запросе /metrics
+# файлы завершившихся процессов переносятся в exited.json и удаляются.
+# Каталог во временной папке контейнера очищается при его перезапуске,
+# счётчики Prometheus при этом начинаются заново.
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-metrics')
+)
+METRICS_FLUSH_INTERVAL = 5
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+                           5, 10)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'foodgram.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -111,9 +186,9 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'users.pagination.CustomLimitPaginator',
     'PAGE_SIZE': 6,
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
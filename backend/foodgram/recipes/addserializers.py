@@ -1,9 +1,25 @@
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import ModelSerializer, SerializerMethodField
 
 from .models import Recipe
 
 
+def get_variant_urls(recipe, request):
+    '''Ссылки на готовые уменьшенные копии изображения рецепта.'''
+    urls = {}
+    for variant, name in recipe.variants.items():
+        url = recipe.image.storage.url(name)
+        urls[variant] = (
+            request.build_absolute_uri(url) if request is not None else url
+        )
+    return urls
+
+
 class BaseRecipeDataSerializer(ModelSerializer):
+    image_variants = SerializerMethodField(read_only=True)
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+    def get_image_variants(self, obj):
+        return get_variant_urls(obj, self.context.get('request'))
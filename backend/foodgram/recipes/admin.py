@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from .models import (Favourites, Ingredient, IngredientRecipe, Recipe,
-                     ShoppingList, Tag, TagRecipe)
+                     ShoppingList, ShoppingListTotal, Tag, TagRecipe)
 
 
 @admin.register(Tag)
@@ -25,22 +25,18 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'author', 'pub_date', 'count_in_favourites')
+    list_display = ('id', 'name', 'author', 'pub_date', 'favourites_count')
     fieldsets = (
         ('Основные данные рецепта', {'fields': (
             'name', ('author', 'pub_date'), 'image', 'text', 'cooking_time'
         )}),
-        ('Добавления в избранное', {'fields': ('count_in_favourites',)})
+        ('Добавления в избранное', {'fields': ('favourites_count',)})
     )
     list_filter = ('author', 'name', 'tags')
     list_display_links = ('id', 'name')
     search_fields = ('id', 'name', 'author')
     ordering = ('id', 'pub_date', 'name')
-    readonly_fields = ('count_in_favourites', 'pub_date')
-
-    @staticmethod
-    def count_in_favourites(obj):
-        return obj.favourites.count()
+    readonly_fields = ('favourites_count', 'pub_date')
 
 
 @admin.register(TagRecipe)
@@ -77,3 +73,13 @@ class ShoppingListAdmin(admin.ModelAdmin):
     list_display_links = ('id', 'user')
     search_fields = ('id', 'user', 'recipe')
     ordering = ('user',)
+
+
+@admin.register(ShoppingListTotal)
+class ShoppingListTotalAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'ingredient', 'amount')
+    list_filter = ('user',)
+    list_display_links = ('id', 'user')
+    search_fields = ('id', 'user', 'ingredient')
+    ordering = ('user',)
+    readonly_fields = ('user', 'ingredient', 'amount')
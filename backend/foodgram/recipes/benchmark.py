@@ -0,0 +1,316 @@
+import shutil
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import CustomUser, SubscribeModel
+
+from . import feed
+from .counters import rebuild_shopping_totals, recount
+from .models import (Favourites, Ingredient, IngredientRecipe, Recipe,
+                     ShoppingList, Tag, TagRecipe)
+
+DATASET_SIZES = (10, 1000, 100000)
+BATCH_SIZE = 1000
+TAGS_COUNT = 20
+INGREDIENTS_COUNT = 500
+INGREDIENTS_PER_RECIPE = 8
+TAGS_PER_RECIPE = 3
+RECIPES_PER_USER = 10
+FAVOURITES_PER_USER = 30
+SUBSCRIPTIONS_PER_USER = 15
+SHOPPING_CART_SIZE = 50
+PAGE_LIMIT = 6
+WRITE_INGREDIENTS_COUNT = 40
+TEST_IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUg'
+    'AAAAEAAAABAgMAAABieywaAAAACVBMVEUAAAD'
+    '///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4b'
+    'AAAACklEQVQImWNoAAAAggCByxOyYQAAAABJRU5ErkJggg=='
+)
+# Замеры очищают кэш: он подменяется локальным, чтобы не затронуть
+# общий кэш работающего приложения.
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'foodgram-benchmark',
+    },
+}
+
+QUERY_BUDGETS = {
+    'recipe-list': 9,
+    'recipe-detail': 7,
+    'ingredient-list': 2,
+    'ingredient-search': 2,
+    'tag-list': 2,
+    'subscription-list': 4,
+    'recipe-feed': 7,
+    'download-shopping-cart': 2,
+    'shopping-cart-totals': 2,
+    'user-list': 5,
+    'recipe-create': 15,
+    'recipe-update-text': 15,
+    'recipe-update-ingredients': 19,
+}
+
+
+@dataclass
+class Measurement:
+    endpoint: str
+    status: int
+    queries: int
+    time_ms: float
+    peak_memory_kb: float
+    budget: int = None
+    warm_queries: int = None
+    duplicates: list = field(default_factory=list)
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.queries > self.budget
+
+
+def get_query_budgets():
+    return {**QUERY_BUDGETS, **getattr(settings, 'API_QUERY_BUDGETS', {})}
+
+
+def batched(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_insert(model, objects):
+    for batch in batched(objects):
+        model.objects.bulk_create(batch)
+
+
+def build_dataset(recipes_count):
+    '''
+    Заполнение базы синтетическими данными:
+    рецепты, тэги, ингредиенты, избранное, подписки и список покупок.
+    Возвращает пользователя, от имени которого выполняются замеры.
+    '''
+    users_count = max(recipes_count // RECIPES_PER_USER, 2)
+    bulk_insert(CustomUser, (
+        CustomUser(
+            email=f'bench{number}@foodgram.ru',
+            username=f'bench{number}',
+            first_name='bench',
+            last_name='bench',
+            password='!'
+        ) for number in range(users_count)
+    ))
+    user_ids = list(CustomUser.objects.filter(
+        username__startswith='bench'
+    ).order_by('id').values_list('id', flat=True))
+    bulk_insert(Tag, (
+        Tag(name=f'bench tag {number}', color=f'#{number:06X}',
+            slug=f'bench-tag-{number}')
+        for number in range(TAGS_COUNT)
+    ))
+    tag_ids = list(Tag.objects.order_by('id').values_list('id', flat=True))
+    bulk_insert(Ingredient, (
+        Ingredient(name=f'bench ingredient {number}', measurement_unit='г')
+        for number in range(INGREDIENTS_COUNT)
+    ))
+    ingredient_ids = list(
+        Ingredient.objects.order_by('id').values_list('id', flat=True)
+    )
+    bulk_insert(Recipe, (
+        Recipe(
+            author_id=user_ids[number % users_count],
+            name=f'bench recipe {number}',
+            image='recipes/bench.png',
+            text='bench text',
+            cooking_time=number % 120 + 1
+        ) for number in range(recipes_count)
+    ))
+    recipe_ids = list(Recipe.objects.order_by('id').values_list(
+        'id', flat=True
+    ))
+    bulk_insert(TagRecipe, (
+        TagRecipe(
+            recipe_id=recipe_id,
+            tag_id=tag_ids[(index + shift) % len(tag_ids)]
+        )
+        for index, recipe_id in enumerate(recipe_ids)
+        for shift in range(TAGS_PER_RECIPE)
+    ))
+    bulk_insert(IngredientRecipe, (
+        IngredientRecipe(
+            recipe_id=recipe_id,
+            ingredient_id=ingredient_ids[
+                (index + shift) % len(ingredient_ids)
+            ],
+            amount=shift + 1
+        )
+        for index, recipe_id in enumerate(recipe_ids)
+        for shift in range(INGREDIENTS_PER_RECIPE)
+    ))
+    favourites = min(FAVOURITES_PER_USER, len(recipe_ids))
+    bulk_insert(Favourites, (
+        Favourites(
+            user_id=user_id,
+            recipe_id=recipe_ids[(index + shift) % len(recipe_ids)]
+        )
+        for index, user_id in enumerate(user_ids)
+        for shift in range(favourites)
+    ))
+    subscriptions = min(SUBSCRIPTIONS_PER_USER, users_count - 1)
+    bulk_insert(SubscribeModel, (
+        SubscribeModel(
+            follower_id=user_id,
+            author_id=user_ids[(index + shift) % users_count]
+        )
+        for index, user_id in enumerate(user_ids)
+        for shift in range(1, subscriptions + 1)
+    ))
+    user = CustomUser.objects.get(id=user_ids[0])
+    bulk_insert(ShoppingList, (
+        ShoppingList(user=user, recipe_id=recipe_id)
+        for recipe_id in recipe_ids[:SHOPPING_CART_SIZE]
+    ))
+    recount()
+    rebuild_shopping_totals()
+    feed.rebuild()
+    return user
+
+
+def get_endpoints(recipe_id):
+    return {
+        'recipe-list': f'/api/recipes/?limit={PAGE_LIMIT}',
+        'recipe-detail': f'/api/recipes/{recipe_id}/',
+        'ingredient-list': '/api/ingredients/',
+        'ingredient-search': '/api/ingredients/?name=bench',
+        'tag-list': '/api/tags/',
+        'subscription-list': (
+            f'/api/users/subscriptions/?limit={PAGE_LIMIT}'
+            '&recipes_limit=3'
+        ),
+        'recipe-feed': f'/api/recipes/feed/?limit={PAGE_LIMIT}',
+        'download-shopping-cart': '/api/recipes/download_shopping_cart/',
+        'shopping-cart-totals': '/api/recipes/shopping_cart_totals/',
+        'user-list': f'/api/users/?limit={PAGE_LIMIT}',
+    }
+
+
+def get_client(user):
+    client = APIClient()
+    token, _ = Token.objects.get_or_create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+def find_duplicates(queries):
+    seen = {}
+    for query in queries:
+        seen[query['sql']] = seen.get(query['sql'], 0) + 1
+    return [sql for sql, count in seen.items() if count > 1]
+
+
+def count_queries(client, url):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+    return len(context)
+
+
+def measure(client, endpoint, url, budget=None, method='get', data=None):
+    cache.clear()
+    tracemalloc.start()
+    start = time.perf_counter()
+    with CaptureQueriesContext(connection) as context:
+        response = getattr(client, method)(url, data=data, format='json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+    elapsed = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return Measurement(
+        endpoint=endpoint,
+        status=response.status_code,
+        queries=len(context),
+        time_ms=elapsed,
+        peak_memory_kb=peak / 1024,
+        budget=budget,
+        warm_queries=(
+            count_queries(client, url) if method == 'get' else None
+        ),
+        duplicates=find_duplicates(context.captured_queries)
+    )
+
+
+@override_settings(CACHES=BENCHMARK_CACHES)
+def run_benchmark(user, endpoints=None):
+    budgets = get_query_budgets()
+    client = get_client(user)
+    recipe_id = Recipe.objects.values_list('id', flat=True).first()
+    urls = get_endpoints(recipe_id)
+    client.get(urls['tag-list'])
+    return [
+        measure(client, endpoint, url, budgets.get(endpoint))
+        for endpoint, url in urls.items()
+        if endpoints is None or endpoint in endpoints
+    ]
+
+
+@override_settings(CACHES=BENCHMARK_CACHES)
+def run_write_benchmark(user, ingredients_count=WRITE_INGREDIENTS_COUNT):
+    '''
+    Замер создания и обновления рецепта с большим количеством
+    ингредиентов: изменение только текста и изменение части ингредиентов.
+    '''
+    budgets = get_query_budgets()
+    client = get_client(user)
+    ingredients = [
+        {'id': pk, 'amount': 1}
+        for pk in Ingredient.objects.values_list(
+            'id', flat=True
+        )[:ingredients_count]
+    ]
+    data = {
+        'tags': list(
+            Tag.objects.values_list('id', flat=True)[:TAGS_PER_RECIPE]
+        ),
+        'ingredients': ingredients,
+        'image': TEST_IMAGE,
+        'name': 'bench write',
+        'text': 'bench text',
+        'cooking_time': 10,
+    }
+    media_root = tempfile.mkdtemp()
+    try:
+        with override_settings(MEDIA_ROOT=media_root):
+            created = measure(
+                client, 'recipe-create', '/api/recipes/',
+                budgets.get('recipe-create'), 'post', data
+            )
+            url = f'/api/recipes/{Recipe.objects.latest("id").id}/'
+            data['text'] = 'bench text changed'
+            updated_text = measure(
+                client, 'recipe-update-text', url,
+                budgets.get('recipe-update-text'), 'patch', data
+            )
+            for ingredient in ingredients[:5]:
+                ingredient['amount'] += 1
+            data['ingredients'] = ingredients[:-5]
+            updated_ingredients = measure(
+                client, 'recipe-update-ingredients', url,
+                budgets.get('recipe-update-ingredients'), 'patch', data
+            )
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+    return [created, updated_text, updated_ingredients]
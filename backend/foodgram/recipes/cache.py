@@ -0,0 +1,197 @@
+import time
+from copy import copy
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from users.models import SubscribeModel
+
+from .models import DataVersion, Favourites, ShoppingList
+
+RECIPES_VERSION = 'recipes'
+TAGS_VERSION = 'tags'
+INGREDIENTS_VERSION = 'ingredients'
+# Счётчики избранного: от них зависят фильтр и сортировка списка рецептов.
+COUNTERS_VERSION = 'counters'
+USER_FLAGS = ('is_favorited', 'is_in_shopping_cart')
+
+stats = {'hits': 0, 'misses': 0}
+
+
+def get_timeout():
+    return getattr(settings, 'RECIPES_CACHE_TIMEOUT', 300)
+
+
+def is_enabled():
+    return getattr(settings, 'RECIPES_CACHE_ENABLED', True)
+
+
+def get_version_timeout():
+    return getattr(settings, 'RECIPES_VERSION_TIMEOUT', 5)
+
+
+def get_version_key(name):
+    return f'version:{name}'
+
+
+def get_versions(*names):
+    '''
+    Версии данных из базы (одним запросом для отсутствующих в кэше).
+    В кэше хранятся не дольше RECIPES_VERSION_TIMEOUT секунд:
+    изменения из других процессов становятся видны не позже
+    чем через это время.
+    '''
+    keys = {name: get_version_key(name) for name in names}
+    cached = cache.get_many(keys.values())
+    versions = {
+        name: cached[key] for name, key in keys.items() if key in cached
+    }
+    missing = [name for name in names if name not in versions]
+    if missing:
+        loaded = DataVersion.objects.get_values(missing)
+        cache.set_many(
+            {keys[name]: loaded[name] for name in missing},
+            get_version_timeout()
+        )
+        versions.update(loaded)
+    return [versions[name] for name in names]
+
+
+def get_version(name):
+    return get_versions(name)[0]
+
+
+def bump_version(name):
+    version = DataVersion.objects.bump(name)
+    cache.set(get_version_key(name), version, get_version_timeout())
+    return version
+
+
+def bump_on_commit(name):
+    '''
+    Смена версии в кэше сразу и в базе после фиксации транзакции:
+    иначе данные, прочитанные до фиксации, попадут в кэш под новой
+    версией. Строка версии не блокируется до конца транзакции.
+    '''
+    if not transaction.get_connection().in_atomic_block:
+        bump_version(name)
+        return
+    cache.set(get_version_key(name), time.time_ns(), get_version_timeout())
+    transaction.on_commit(lambda: bump_version(name))
+
+
+def invalidate_recipes():
+    bump_on_commit(RECIPES_VERSION)
+
+
+def invalidate_counters():
+    bump_on_commit(COUNTERS_VERSION)
+
+
+def get_origin(request):
+    '''
+    Схема и хост запроса: данные в кэше содержат абсолютные ссылки
+    (изображения, соседние страницы), поэтому хранятся отдельно
+    для каждого адреса, по которому обращаются к сайту.
+    '''
+    return f'{request.scheme}://{request.get_host()}'
+
+
+def get_recipe_keys(ids, origin):
+    version = get_version(RECIPES_VERSION)
+    return {pk: f'recipes:{version}:{origin}:recipe:{pk}' for pk in ids}
+
+
+def get_page_key(request, versions):
+    version = ':'.join(map(str, get_versions(*versions)))
+    return (f'recipes:{version}:{get_origin(request)}'
+            f':page:{request.get_full_path()}')
+
+
+def get_page(request, versions):
+    page = cache.get(get_page_key(request, versions))
+    stats['misses' if page is None else 'hits'] += 1
+    return page
+
+
+def set_page(request, page, versions):
+    cache.set(get_page_key(request, versions), page, get_timeout())
+
+
+def get_shared_recipes(ids, serialize, request):
+    '''
+    Общая для всех пользователей часть представления рецептов.
+    Отсутствующие в кэше рецепты сериализуются функцией serialize
+    и сохраняются в кэш.
+    '''
+    keys = get_recipe_keys(ids, get_origin(request))
+    cached = cache.get_many(keys.values())
+    recipes = {
+        pk: cached[key] for pk, key in keys.items() if key in cached
+    }
+    missing = [pk for pk in ids if pk not in recipes]
+    stats['hits'] += len(recipes)
+    stats['misses'] += len(missing)
+    if missing:
+        serialized = {recipe['id']: recipe for recipe in serialize(missing)}
+        cache.set_many(
+            {keys[pk]: recipe for pk, recipe in serialized.items()},
+            get_timeout()
+        )
+        recipes.update(serialized)
+    return [recipes[pk] for pk in ids if pk in recipes]
+
+
+def get_user_key(user_id):
+    return f'recipes:user:{user_id}'
+
+
+def get_user_version(user_id):
+    return f'user:{user_id}'
+
+
+def invalidate_user(user_id):
+    cache.delete(get_user_key(user_id))
+    bump_on_commit(get_user_version(user_id))
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.delete(get_user_key(user_id)))
+
+
+def get_user_flags(user):
+    key = get_user_key(user.id)
+    flags = cache.get(key)
+    if flags is not None:
+        stats['hits'] += 1
+        return flags
+    stats['misses'] += 1
+    flags = {
+        'is_favorited': set(Favourites.objects.filter(
+            user=user
+        ).values_list('recipe_id', flat=True)),
+        'is_in_shopping_cart': set(ShoppingList.objects.filter(
+            user=user
+        ).values_list('recipe_id', flat=True)),
+        'is_subscribed': set(SubscribeModel.objects.filter(
+            follower=user
+        ).values_list('author_id', flat=True)),
+    }
+    cache.set(key, flags, get_timeout())
+    return flags
+
+
+def overlay_user_flags(recipes, user):
+    '''Подстановка в общие данные рецептов флагов текущего пользователя.'''
+    if user.is_anonymous:
+        return recipes
+    flags = get_user_flags(user)
+    result = []
+    for recipe in recipes:
+        recipe = copy(recipe)
+        for flag in USER_FLAGS:
+            recipe[flag] = recipe['id'] in flags[flag]
+        recipe['author'] = copy(recipe['author'])
+        recipe['author']['is_subscribed'] = (
+            recipe['author']['id'] in flags['is_subscribed']
+        )
+        result.append(recipe)
+    return result
@@ -0,0 +1,94 @@
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def get_counters(apps=global_apps):
+    recipe = apps.get_model('recipes', 'Recipe')
+    favourites = apps.get_model('recipes', 'Favourites')
+    user = apps.get_model('users', 'CustomUser')
+    subscribe = apps.get_model('users', 'SubscribeModel')
+    return (
+        (recipe, 'favourites_count', favourites, 'recipe'),
+        (user, 'recipes_count', recipe, 'author'),
+        (user, 'followers_count', subscribe, 'author'),
+    )
+
+
+def count_related(related_model, related_field):
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{related_field: OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+def recount(apps=global_apps, fix=True):
+    '''
+    Сверка хранимых счётчиков с фактическим количеством связанных записей.
+    Возвращает количество расхождений по каждому счётчику
+    и при fix=True исправляет их.
+    '''
+    drift = {}
+    for model, field, related_model, related_field in get_counters(apps):
+        actual = count_related(related_model, related_field)
+        drifted = model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}
+        )
+        name = f'{model.__name__}.{field}'
+        drift[name] = drifted.count()
+        if fix and drift[name]:
+            model.objects.filter(
+                pk__in=drifted.values('pk')
+            ).update(**{field: actual})
+    return drift
+
+
+def rebuild_shopping_totals(apps=global_apps, batch_size=1000):
+    '''Пересчёт итогов списков покупок всех пользователей.'''
+    ingredient_recipe = apps.get_model('recipes', 'IngredientRecipe')
+    total_model = apps.get_model('recipes', 'ShoppingListTotal')
+    totals = ingredient_recipe.objects.filter(
+        recipe__shoppinglist__isnull=False
+    ).values(
+        'recipe__shoppinglist__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by().values_list(
+        'recipe__shoppinglist__user_id', 'ingredient_id', 'total'
+    )
+    created = 0
+    with transaction.atomic():
+        total_model.objects.all().delete()
+        batch = []
+        for user_id, ingredient_id, amount in totals.iterator():
+            batch.append(total_model(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount
+            ))
+            if len(batch) == batch_size:
+                total_model.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        total_model.objects.bulk_create(batch)
+    return created + len(batch)
+
+
+def increment(model, pk, field):
+    model.objects.filter(pk=pk).update(**{field: F(field) + 1})
+
+
+def decrement(model, pk, field):
+    model.objects.filter(pk=pk, **{f'{field}__gt': 0}).update(
+        **{field: F(field) - 1}
+    )
+
+
+def increment_many(model, pks, field):
+    model.objects.filter(pk__in=pks).update(**{field: F(field) + 1})
+
+
+def decrement_many(model, pks, field):
+    model.objects.filter(pk__in=pks, **{f'{field}__gt': 0}).update(
+        **{field: F(field) - 1}
+    )
@@ -0,0 +1,107 @@
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import connection
+
+BATCH_SIZE = 1000
+
+
+def insert_entries(model, entries, batch_size=BATCH_SIZE):
+    created = 0
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) == batch_size:
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+        created += len(batch)
+    return created
+
+
+def is_popular(author_id, apps=global_apps):
+    user = apps.get_model('users', 'CustomUser')
+    return user.objects.filter(
+        id=author_id, followers_count__gte=settings.FEED_FANOUT_LIMIT
+    ).exists()
+
+
+def fan_out(recipe_id, apps=global_apps):
+    '''
+    Рассылка нового рецепта в ленты подписчиков автора. Рецепты
+    авторов с большим числом подписчиков не рассылаются.
+    '''
+    recipe = apps.get_model('recipes', 'Recipe')
+    feed_entry = apps.get_model('recipes', 'FeedEntry')
+    subscribe = apps.get_model('users', 'SubscribeModel')
+    author_id = recipe.objects.filter(id=recipe_id).values_list(
+        'author_id', flat=True
+    ).first()
+    if author_id is None or is_popular(author_id, apps):
+        return 0
+    followers = subscribe.objects.filter(author_id=author_id).values_list(
+        'follower_id', flat=True
+    )
+    return insert_entries(feed_entry, (
+        feed_entry(user_id=user_id, recipe_id=recipe_id, author_id=author_id)
+        for user_id in followers.iterator()
+    ))
+
+
+def backfill(author_id, follower_ids=None, apps=global_apps):
+    '''
+    Добавление рецептов автора в ленты подписчиков: нового подписчика
+    или, если follower_ids не указан, всех подписчиков автора.
+    '''
+    recipe = apps.get_model('recipes', 'Recipe')
+    feed_entry = apps.get_model('recipes', 'FeedEntry')
+    subscribe = apps.get_model('users', 'SubscribeModel')
+    if is_popular(author_id, apps):
+        return 0
+    if follower_ids is None:
+        follower_ids = list(subscribe.objects.filter(
+            author_id=author_id
+        ).values_list('follower_id', flat=True))
+    recipes = recipe.objects.filter(author_id=author_id).values_list(
+        'id', flat=True
+    )
+    return insert_entries(feed_entry, (
+        feed_entry(user_id=user_id, recipe_id=recipe_id, author_id=author_id)
+        for recipe_id in recipes.iterator()
+        for user_id in follower_ids
+    ))
+
+
+def remove(follower_id, author_id, apps=global_apps):
+    feed_entry = apps.get_model('recipes', 'FeedEntry')
+    feed_entry.objects.filter(
+        user_id=follower_id, author_id=author_id
+    ).delete()
+
+
+def rebuild(apps=global_apps):
+    '''
+    Заполнение лент по всем существующим подпискам одним запросом
+    INSERT ... SELECT.
+    '''
+    recipe = apps.get_model('recipes', 'Recipe')
+    feed_entry = apps.get_model('recipes', 'FeedEntry')
+    subscribe = apps.get_model('users', 'SubscribeModel')
+    user = apps.get_model('users', 'CustomUser')
+    feed_entry.objects.all().delete()
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(feed_entry._meta.db_table)} '
+            f'(user_id, recipe_id, author_id) '
+            f'SELECT subscribe.follower_id, recipe.id, recipe.author_id '
+            f'FROM {quote(subscribe._meta.db_table)} subscribe '
+            f'JOIN {quote(recipe._meta.db_table)} recipe '
+            f'ON recipe.author_id = subscribe.author_id '
+            f'JOIN {quote(user._meta.db_table)} author '
+            f'ON author.id = subscribe.author_id '
+            f'WHERE author.followers_count < %s',
+            [settings.FEED_FANOUT_LIMIT]
+        )
+        return cursor.rowcount
@@ -0,0 +1,23 @@
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework.fields import ImageField
+
+from .parsers import IMAGE_HEADER_LIMIT, check_image_header, check_image_size
+
+
+class RecipeImageField(Base64ImageField):
+    '''
+    Изображение строкой base64 или файлом из multipart-запроса.
+    Для base64 размер проверяется до декодирования.
+    '''
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            return ImageField.to_internal_value(self, data)
+        if isinstance(data, str):
+            check_image_size(len(data) * 3 // 4)
+        image = super().to_internal_value(data)
+        if image is not None:
+            check_image_header(image.read(IMAGE_HEADER_LIMIT))
+            image.seek(0)
+        return image
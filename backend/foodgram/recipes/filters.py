@@ -1,8 +1,9 @@
-from django_filters.rest_framework import (AllValuesMultipleFilter,
-                                           BooleanFilter, CharFilter,
-                                           FilterSet)
+from django_filters.rest_framework import (BooleanFilter, CharFilter,
+                                           FilterSet,
+                                           ModelMultipleChoiceFilter,
+                                           NumberFilter, OrderingFilter)
 
-from .models import Ingredient, Recipe
+from .models import Ingredient, Recipe, Tag
 
 
 class RecipeFilter(FilterSet):
@@ -12,12 +13,29 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = BooleanFilter(
         method="filter_is_in_shopping_cart"
     )
-    tags = AllValuesMultipleFilter(field_name='tags__slug')
+    tags = ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all()
+    )
+    min_favourites = NumberFilter(
+        field_name='favourites_count', lookup_expr='gte'
+    )
+    ordering = OrderingFilter(
+        fields=('pub_date', 'favourites_count')
+    )
 
     class Meta:
         model = Recipe
         fields = ('author',)
 
+    @staticmethod
+    def uses_counters(params):
+        '''Зависит ли результат от счётчиков избранного.'''
+        return 'min_favourites' in params or (
+            'favourites_count' in params.get('ordering', '')
+        )
+
     def filter_is_favorited(self, queryset, name, value):
         if value:
             return queryset.filter(favourites__user=self.request.user)
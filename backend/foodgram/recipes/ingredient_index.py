@@ -0,0 +1,80 @@
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+
+from . import cache
+from .models import Ingredient
+
+
+def normalize(value):
+    return value.casefold().replace('ё', 'е').strip()
+
+
+class IngredientIndex:
+    '''
+    Отсортированный индекс ингредиентов в памяти процесса
+    для поиска по началу и по вхождению названия.
+    Перестраивается при изменении версии таблицы ингредиентов:
+    версия хранится в базе, поэтому загрузка ингредиентов в другом
+    процессе видна не позже чем через RECIPES_VERSION_TIMEOUT секунд.
+    '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.version = None
+        # Ключи и ингредиенты публикуются одним присваиванием:
+        # читатели без блокировки не смешают старый и новый индекс.
+        self.index = ([], [])
+
+    def build(self):
+        entries = sorted(
+            (normalize(item['name']), item['measurement_unit'], item['id'],
+             item)
+            for item in Ingredient.objects.values(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        self.index = (
+            [entry[0] for entry in entries],
+            [entry[-1] for entry in entries]
+        )
+
+    def refresh(self):
+        version = cache.get_version(cache.INGREDIENTS_VERSION)
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                self.build()
+                self.version = version
+
+    def all(self):
+        self.refresh()
+        _, items = self.index
+        return list(items)
+
+    def search(self, query, limit=None):
+        self.refresh()
+        if limit is None:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        query = normalize(query)
+        keys, items = self.index
+        results = []
+        position = bisect_left(keys, query)
+        while (
+            position < len(keys) and len(results) < limit
+            and keys[position].startswith(query)
+        ):
+            results.append(items[position])
+            position += 1
+        if len(results) < limit:
+            for key, item in zip(keys, items):
+                if query in key and not key.startswith(query):
+                    results.append(item)
+                    if len(results) == limit:
+                        break
+        return results
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,238 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from random import Random
+
+import requests
+
+PAGE_LIMIT = 6
+RECIPES_LIMIT = 3
+PERCENTILES = (50, 90, 95, 99)
+REQUEST_TIMEOUT = 30
+
+
+@dataclass
+class EndpointStats:
+    latencies: list = field(default_factory=list)
+    errors: int = 0
+
+    def percentile(self, percent):
+        '''Процентиль задержки в миллисекундах (метод ближайшего ранга).'''
+        if not self.latencies:
+            return 0
+        values = sorted(self.latencies)
+        rank = math.ceil(percent / 100 * len(values))
+        return values[max(rank, 1) - 1]
+
+
+class Client:
+    '''Сессия одного пользователя с замером времени ответа по эндпоинтам.'''
+
+    def __init__(self, base_url, random, data):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        self.random = random
+        self.data = data
+        self.stats = defaultdict(EndpointStats)
+
+    def request(self, name, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, self.base_url + path, timeout=REQUEST_TIMEOUT,
+                **kwargs
+            )
+            failed = response.status_code >= 500
+        except requests.RequestException:
+            response = None
+            failed = True
+        stats = self.stats[name]
+        stats.latencies.append((time.perf_counter() - started) * 1000)
+        stats.errors += failed
+        return response
+
+    def login(self, email, password):
+        response = self.request(
+            'login', 'post', '/api/auth/token/login/',
+            json={'email': email, 'password': password}
+        )
+        if response is None or response.status_code != 200:
+            raise RuntimeError(f'Не удалось войти как {email}')
+        self.session.headers['Authorization'] = (
+            f'Token {response.json()["auth_token"]}'
+        )
+
+    def choice(self, name):
+        return self.random.choice(self.data[name])
+
+
+# Действия повторяют запросы SPA: главная страница с фильтром по тэгам,
+# карточка рецепта, избранное, список покупок, подписки и поиск
+# ингредиентов в форме рецепта.
+def recipe_list(client):
+    page = client.random.randint(1, 5)
+    tags = ''.join(
+        f'&tags={slug}' for slug in client.data['tags']
+        if client.random.random() < 0.5
+    )
+    client.request(
+        'recipe-list', 'get',
+        f'/api/recipes/?page={page}&limit={PAGE_LIMIT}{tags}'
+    )
+
+
+def recipe_detail(client):
+    client.request(
+        'recipe-detail', 'get', f'/api/recipes/{client.choice("recipes")}/'
+    )
+
+
+def author_recipes(client):
+    client.request(
+        'author-recipes', 'get',
+        f'/api/recipes/?page=1&limit={PAGE_LIMIT}'
+        f'&author={client.choice("authors")}'
+    )
+
+
+def favourite_recipes(client):
+    client.request(
+        'favorite-list', 'get',
+        f'/api/recipes/?page=1&limit={PAGE_LIMIT}&is_favorited=1'
+    )
+
+
+def toggle(client, name, path):
+    response = client.request(f'{name}-add', 'post', path)
+    if response is not None and response.status_code == 400:
+        client.request(f'{name}-delete', 'delete', path)
+
+
+def toggle_favourite(client):
+    toggle(
+        client, 'favorite',
+        f'/api/recipes/{client.choice("recipes")}/favorite/'
+    )
+
+
+def toggle_shopping_cart(client):
+    toggle(
+        client, 'shopping-cart',
+        f'/api/recipes/{client.choice("recipes")}/shopping_cart/'
+    )
+
+
+def download_shopping_cart(client):
+    client.request(
+        'download-shopping-cart', 'get',
+        '/api/recipes/download_shopping_cart/'
+    )
+
+
+def subscription_list(client):
+    client.request(
+        'subscription-list', 'get',
+        f'/api/users/subscriptions/?page=1&limit={PAGE_LIMIT}'
+        f'&recipes_limit={RECIPES_LIMIT}'
+    )
+
+
+def toggle_subscription(client):
+    toggle(
+        client, 'subscribe',
+        f'/api/users/{client.choice("authors")}/subscribe/'
+    )
+
+
+def ingredient_search(client):
+    client.request(
+        'ingredient-search', 'get',
+        f'/api/ingredients/?name={client.choice("prefixes")}'
+    )
+
+
+def tag_list(client):
+    client.request('tag-list', 'get', '/api/tags/')
+
+
+def user_me(client):
+    client.request('user-me', 'get', '/api/users/me/')
+
+
+ACTIONS = (
+    (recipe_list, 30),
+    (recipe_detail, 20),
+    (author_recipes, 5),
+    (favourite_recipes, 4),
+    (toggle_favourite, 8),
+    (toggle_shopping_cart, 5),
+    (download_shopping_cart, 2),
+    (subscription_list, 5),
+    (toggle_subscription, 3),
+    (ingredient_search, 8),
+    (tag_list, 5),
+    (user_me, 5),
+)
+
+
+def run_client(client, deadline):
+    actions, weights = zip(*ACTIONS)
+    while time.monotonic() < deadline:
+        client.random.choices(actions, weights=weights)[0](client)
+
+
+def run_load_test(base_url, credentials, data, duration, seed=None):
+    '''
+    Нагрузка смесью запросов SPA: по потоку на каждую пару
+    (email, пароль) из credentials в течение duration секунд.
+    Возвращает статистику по эндпоинтам и фактическую длительность.
+    '''
+    random = Random(seed)
+    clients = [
+        Client(base_url, Random(random.random()), data)
+        for _ in credentials
+    ]
+    for client, (email, password) in zip(clients, credentials):
+        client.login(email, password)
+        client.stats.clear()
+    started = time.monotonic()
+    threads = [
+        threading.Thread(
+            target=run_client, args=(client, started + duration)
+        ) for client in clients
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    results = defaultdict(EndpointStats)
+    for client in clients:
+        for name, stats in client.stats.items():
+            results[name].latencies.extend(stats.latencies)
+            results[name].errors += stats.errors
+    return dict(sorted(results.items())), elapsed
+
+
+def format_report(results, elapsed):
+    header = ('endpoint', 'requests', 'errors', 'rps',
+              *(f'p{percent}' for percent in PERCENTILES), 'max')
+    lines = ['{:<24} {:>8} {:>6} {:>7}'.format(*header[:4]) + ''.join(
+        f' {name:>8}' for name in header[4:]
+    )]
+    total = EndpointStats()
+    for name, stats in (*results.items(), ('total', total)):
+        if name != 'total':
+            total.latencies.extend(stats.latencies)
+            total.errors += stats.errors
+        count = len(stats.latencies)
+        lines.append(
+            f'{name:<24} {count:>8} {stats.errors:>6} '
+            f'{count / elapsed if elapsed else 0:>7.1f}' + ''.join(
+                f' {stats.percentile(percent):>8.1f}'
+                for percent in (*PERCENTILES, 100)
+            )
+        )
+    return '\n'.join(lines)
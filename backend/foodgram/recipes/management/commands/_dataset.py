@@ -0,0 +1,478 @@
+'''
+Общие средства команд export_recipes, import_recipes и generate_data:
+описание выгружаемых таблиц, чтение и запись NDJSON и CSV, запись
+в базу пачками.
+'''
+import csv
+import json
+import os
+import sys
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from io import StringIO
+from itertools import groupby, islice
+from operator import itemgetter
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import CommandError
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+from recipes import cache, feed
+from recipes.counters import rebuild_shopping_totals, recount
+from recipes.models import (Favourites, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingList, Tag, TagRecipe)
+from users.models import CustomUser, SubscribeModel
+
+FORMATS = ('ndjson', 'csv')
+BATCH_SIZE = 5000
+SECTION_FIELD = 'section'
+USER_PASSWORD_FIELD = 'password'
+
+
+@dataclass(frozen=True)
+class Section:
+    '''
+    Выгружаемая таблица. Записи разделов с ключом key сопоставляются
+    с существующими по этому ключу; записи с полем id получают новые
+    id; ссылки refs переводятся в новые id по таблицам соответствия.
+    '''
+    name: str
+    model: type
+    fields: tuple
+    key: tuple = ()
+    refs: dict = field(default_factory=dict)
+
+    @property
+    def has_ids(self):
+        return 'id' in self.fields
+
+
+SECTIONS = (
+    Section('users', CustomUser, (
+        'id', 'email', 'username', 'first_name', 'last_name',
+        'date_joined', 'is_blocked'
+    ), key=('email',)),
+    Section('tags', Tag, ('id', 'name', 'color', 'slug'), key=('slug',)),
+    Section('ingredients', Ingredient, (
+        'id', 'name', 'measurement_unit'
+    ), key=('name', 'measurement_unit')),
+    Section('recipes', Recipe, (
+        'id', 'author_id', 'name', 'pub_date', 'image', 'text',
+        'cooking_time'
+    ), refs={'author_id': 'users'}),
+    Section('tag_recipes', TagRecipe, ('tag_id', 'recipe_id'), refs={
+        'tag_id': 'tags', 'recipe_id': 'recipes'
+    }),
+    Section('ingredient_recipes', IngredientRecipe, (
+        'ingredient_id', 'recipe_id', 'amount'
+    ), refs={'ingredient_id': 'ingredients', 'recipe_id': 'recipes'}),
+    Section('favourites', Favourites, ('user_id', 'recipe_id'), refs={
+        'user_id': 'users', 'recipe_id': 'recipes'
+    }),
+    Section('shopping_list', ShoppingList, ('user_id', 'recipe_id'), refs={
+        'user_id': 'users', 'recipe_id': 'recipes'
+    }),
+    Section('subscriptions', SubscribeModel, (
+        'author_id', 'follower_id'
+    ), refs={'author_id': 'users', 'follower_id': 'users'}),
+)
+SECTIONS_BY_NAME = {section.name: section for section in SECTIONS}
+
+
+def use_copy():
+    return connection.vendor == 'postgresql'
+
+
+def get_fields(section, with_passwords=False):
+    if section.model is CustomUser and with_passwords:
+        return section.fields + (USER_PASSWORD_FIELD,)
+    return section.fields
+
+
+def get_columns(model, fields):
+    quote = connection.ops.quote_name
+    return ', '.join(
+        quote(model._meta.get_field(name).column) for name in fields
+    )
+
+
+def get_format(path, file_format):
+    '''
+    Формат по пути: каталог или путь без расширения — CSV,
+    иначе NDJSON. Поток (-) бывает только NDJSON.
+    '''
+    if path == '-':
+        if file_format == 'csv':
+            raise CommandError(
+                'CSV записывается в каталог: для stdin и stdout '
+                'используйте формат ndjson'
+            )
+        return 'ndjson'
+    if file_format:
+        return file_format
+    return 'csv' if os.path.isdir(path) or not os.path.splitext(path)[1] \
+        else 'ndjson'
+
+
+def iter_rows(section, fields, batch_size):
+    return section.model.objects.order_by('pk').values_list(
+        *fields
+    ).iterator(chunk_size=batch_size)
+
+
+def encode_value(value):
+    '''Даты записываются в ISO 8601 с точностью до микросекунд.'''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def write_ndjson(file, sections, batch_size, with_passwords=False):
+    '''Запись всех разделов в один поток NDJSON. Возвращает счётчики.'''
+    counts = Counter()
+    encoder = json.JSONEncoder(ensure_ascii=False, default=encode_value)
+    for section in sections:
+        fields = get_fields(section, with_passwords)
+        for row in iter_rows(section, fields, batch_size):
+            file.write(encoder.encode(
+                {SECTION_FIELD: section.name, **dict(zip(fields, row))}
+            ))
+            file.write('\n')
+            counts[section.name] += 1
+    return counts
+
+
+def copy_to(file, section, fields):
+    '''Выгрузка таблицы командой COPY PostgreSQL.'''
+    table = connection.ops.quote_name(section.model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY (SELECT {get_columns(section.model, fields)} '
+            f'FROM {table} ORDER BY 1) TO STDOUT WITH (FORMAT csv, HEADER)',
+            file
+        )
+
+
+def write_csv(directory, sections, batch_size, with_passwords=False):
+    '''Запись каждого раздела в отдельный файл CSV в каталоге.'''
+    counts = Counter()
+    os.makedirs(directory, exist_ok=True)
+    for section in sections:
+        fields = get_fields(section, with_passwords)
+        path = os.path.join(directory, f'{section.name}.csv')
+        with open(path, 'w', encoding='UTF-8', newline='') as file:
+            if use_copy():
+                copy_to(file, section, fields)
+                counts[section.name] = section.model.objects.count()
+                continue
+            writer = csv.writer(file)
+            writer.writerow(fields)
+            for row in iter_rows(section, fields, batch_size):
+                writer.writerow(encode_value(value) for value in row)
+                counts[section.name] += 1
+    return counts
+
+
+def open_output(path):
+    if path == '-':
+        return nullcontext(sys.stdout)
+    return open(path, 'w', encoding='UTF-8')
+
+
+def read_ndjson(path):
+    '''Чтение записей NDJSON: пары (раздел, словарь полей).'''
+    with (nullcontext(sys.stdin) if path == '-'
+          else open(path, encoding='UTF-8')) as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                yield record.pop(SECTION_FIELD), record
+            except (ValueError, KeyError, AttributeError, TypeError):
+                raise CommandError(f'Ошибка в данных: строка №{number}')
+
+
+def read_csv(directory):
+    '''Чтение файлов CSV каталога в порядке разделов.'''
+    for section in SECTIONS:
+        path = os.path.join(directory, f'{section.name}.csv')
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='UTF-8', newline='') as file:
+            for record in csv.DictReader(file):
+                yield section.name, record
+
+
+@contextmanager
+def keep_auto_now(model):
+    '''Сохранение дат из файла вместо текущего времени в auto_now_add.'''
+    fields = [
+        model_field for model_field in model._meta.concrete_fields
+        if getattr(model_field, 'auto_now_add', False)
+    ]
+    for model_field in fields:
+        model_field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for model_field in fields:
+            model_field.auto_now_add = True
+
+
+def get_next_id(model):
+    '''
+    Первый свободный id таблицы. Строки записываются с заранее
+    назначенными id, после загрузки счётчики id сбрасываются
+    функцией reset_sequences.
+    '''
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def reset_sequences(models):
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+def insert_rows(model, rows):
+    '''
+    Запись словарей значений: командой COPY на PostgreSQL,
+    иначе через bulk_create. Конфликтующие строки пропускаются.
+    '''
+    if not rows:
+        return
+    if use_copy():
+        copy_rows(model, rows)
+        return
+    with keep_auto_now(model):
+        model.objects.bulk_create(
+            (model(**values) for values in rows), ignore_conflicts=True
+        )
+
+
+def encode_copy_value(value):
+    '''
+    Поле CSV для COPY: None записывается пустым полем без кавычек
+    (NULL), остальные значения — в кавычках, поэтому пустая строка
+    не превращается в NULL.
+    '''
+    if value is None:
+        return ''
+    return '"{}"'.format(str(value).replace('"', '""'))
+
+
+def copy_rows(model, rows):
+    '''
+    Запись строк командой COPY через временную таблицу.
+    Незаполненные поля получают значения по умолчанию из модели.
+    '''
+    fields = [
+        model_field.attname for model_field in model._meta.concrete_fields
+        if model_field.attname in rows[0] or not model_field.primary_key
+    ]
+    columns = get_columns(model, fields)
+    table = connection.ops.quote_name(model._meta.db_table)
+    buffer = StringIO()
+    for values in rows:
+        instance = model(**values)
+        buffer.write(','.join(
+            encode_copy_value(getattr(instance, name)) for name in fields
+        ))
+        buffer.write('\n')
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE import_rows AS '
+            f'SELECT {columns} FROM {table} WITH NO DATA'
+        )
+        cursor.copy_expert(
+            f'COPY import_rows ({columns}) FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) SELECT {columns} '
+            f'FROM import_rows ON CONFLICT DO NOTHING'
+        )
+        cursor.execute('DROP TABLE import_rows')
+
+
+def refresh_derived_data(changed_user_ids=()):
+    '''
+    Пакетная запись не вызывает сигналы: счётчики, итоги списков
+    покупок и ленты пересчитываются целиком, кэш сбрасывается.
+    '''
+    recount()
+    rebuild_shopping_totals()
+    feed.rebuild()
+    for version in (cache.RECIPES_VERSION, cache.TAGS_VERSION,
+                    cache.INGREDIENTS_VERSION, cache.COUNTERS_VERSION):
+        cache.bump_on_commit(version)
+    for user_id in changed_user_ids:
+        cache.invalidate_user(user_id)
+
+
+class Importer:
+    '''
+    Загрузка записей пачками. Разделы должны идти в порядке SECTIONS:
+    ссылки переводятся в новые id по таблицам соответствия,
+    заполненным при загрузке предыдущих разделов.
+    '''
+
+    def __init__(self, batch_size=BATCH_SIZE, stdout=None):
+        self.batch_size = batch_size
+        self.stdout = stdout
+        self.maps = {section.name: {} for section in SECTIONS}
+        self.next_ids = {}
+        self.matched_users = set()
+        self.counts = {section.name: Counter() for section in SECTIONS}
+
+    def run(self, records):
+        position = 0
+        for name, group in groupby(records, key=itemgetter(0)):
+            section = SECTIONS_BY_NAME.get(name)
+            if section is None:
+                raise CommandError(f'Неизвестный раздел: {name}')
+            if SECTIONS.index(section) < position:
+                raise CommandError(
+                    f'Раздел {name} должен предшествовать '
+                    f'{SECTIONS[position].name}'
+                )
+            position = SECTIONS.index(section)
+            self.load_section(section, (record for _, record in group))
+        self.reset_sequences()
+        return self.counts
+
+    def load_section(self, section, records):
+        '''
+        Загрузка раздела пачками. Для таблиц связей число добавленных
+        строк определяется по размеру таблицы до и после загрузки.
+        '''
+        counts = self.counts[section.name]
+        before = 0 if section.has_ids else section.model.objects.count()
+        written = 0
+        while True:
+            batch = list(islice(records, self.batch_size))
+            if not batch:
+                break
+            written += self.flush(section, batch)
+        if not section.has_ids:
+            inserted = section.model.objects.count() - before
+            counts['inserted'] += inserted
+            counts['skipped'] += written - inserted
+
+    def convert(self, section, record):
+        '''
+        Приведение значений к типам полей и перевод ссылок.
+        Возвращает пару (старый id, значения) или None.
+        '''
+        values = {}
+        for name in get_fields(section, with_passwords=True):
+            value = record.get(name)
+            if name == 'id':
+                continue
+            if name in section.refs:
+                value = self.maps[section.refs[name]].get(
+                    int(value) if value not in (None, '') else None
+                )
+            elif name == USER_PASSWORD_FIELD:
+                value = value or make_password(None)
+            else:
+                value = self.to_python(section.model, name, value)
+            if value in (None, '') and (
+                name in section.refs or name in section.key
+            ):
+                return None
+            values[name] = value
+        return int(record['id']) if section.has_ids else None, values
+
+    @staticmethod
+    def to_python(model, name, value):
+        model_field = model._meta.get_field(name)
+        if value == '' and not model_field.empty_strings_allowed:
+            value = None
+        if value is None and model_field.has_default():
+            return model_field.get_default()
+        if value is None and getattr(model_field, 'auto_now_add', False):
+            return timezone.now()
+        return model_field.to_python(value)
+
+    def flush(self, section, records):
+        '''Запись пачки. Возвращает число строк, переданных в базу.'''
+        counts = self.counts[section.name]
+        rows = []
+        for record in records:
+            try:
+                row = self.convert(section, record)
+            except Exception as error:
+                raise CommandError(
+                    f'Ошибка в данных раздела {section.name}: {error}'
+                )
+            if row is None:
+                counts['skipped'] += 1
+            else:
+                rows.append(row)
+        if section.key:
+            rows = self.match(section, rows)
+        if section.has_ids:
+            self.insert_new(section, rows)
+        else:
+            insert_rows(section.model, [values for _, values in rows])
+        if self.stdout is not None:
+            self.stdout.write(f'{section.name}: прочитано {len(records)}')
+        return len(rows)
+
+    def match(self, section, rows):
+        '''
+        Сопоставление записей с существующими по ключу раздела.
+        Возвращает записи, которых в базе нет.
+        '''
+        first = section.key[0]
+        existing = {
+            tuple(values): pk for pk, *values in
+            section.model.objects.filter(**{
+                f'{first}__in': {values[first] for _, values in rows}
+            }).values_list('pk', *section.key)
+        }
+        new = []
+        for old_id, values in rows:
+            pk = existing.get(tuple(values[name] for name in section.key))
+            if pk is None:
+                new.append((old_id, values))
+                continue
+            self.maps[section.name][old_id] = pk
+            self.counts[section.name]['matched'] += 1
+            if section.model is CustomUser:
+                self.matched_users.add(pk)
+        return new
+
+    def insert_new(self, section, rows):
+        '''
+        Запись новых строк с заранее назначенными id. Строки,
+        отклонённые ограничениями уникальности, пропускаются.
+        '''
+        model = section.model
+        if model not in self.next_ids:
+            self.next_ids[model] = get_next_id(model)
+        pairs = {}
+        for old_id, values in rows:
+            values['id'] = self.next_ids[model]
+            self.next_ids[model] += 1
+            pairs[values['id']] = old_id
+        insert_rows(model, [values for _, values in rows])
+        inserted = model.objects.filter(pk__in=pairs).values_list(
+            'pk', flat=True
+        )
+        mapping = self.maps[section.name]
+        for pk in inserted:
+            mapping[pairs.pop(pk)] = pk
+        self.counts[section.name]['inserted'] += len(rows) - len(pairs)
+        self.counts[section.name]['skipped'] += len(pairs)
+
+    def reset_sequences(self):
+        reset_sequences(list(self.next_ids))
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from recipes.benchmark import (BENCHMARK_CACHES, DATASET_SIZES, build_dataset,
+                               run_benchmark, run_write_benchmark)
+
+
+class Command(BaseCommand):
+    help = ('Замер количества запросов к базе, времени ответа и пикового '
+            'потребления памяти для эндпоинтов API на синтетических данных. '
+            'Данные создаются во временной тестовой базе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', type=int, default=list(DATASET_SIZES),
+            help='Количество рецептов в наборах данных'
+        )
+        parser.add_argument(
+            '--endpoints', nargs='+',
+            help='Ограничить замер указанными эндпоинтами'
+        )
+        parser.add_argument(
+            '--write', action='store_true',
+            help='Дополнительно замерить создание и обновление рецепта'
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не удалять тестовую базу после замера'
+        )
+
+    def benchmark(self, size, options):
+        '''Замер на наборе данных size. Возвращает превысившие бюджет.'''
+        failed = []
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb']
+        )
+        try:
+            self.stdout.write(f'Набор данных: {size} рецептов')
+            user = build_dataset(size)
+            results = run_benchmark(user, options['endpoints'])
+            if options['write']:
+                results += run_write_benchmark(user)
+            for result in results:
+                self.stdout.write(
+                    f'  {result.endpoint:<24} {result.status} '
+                    f'queries={result.queries:<4} '
+                    f'budget={result.budget} '
+                    f'warm={result.warm_queries} '
+                    f'time={result.time_ms:.1f}ms '
+                    f'peak={result.peak_memory_kb:.0f}KB'
+                )
+                if result.over_budget:
+                    failed.append(f'{result.endpoint} ({size})')
+                    for sql in result.duplicates:
+                        self.stdout.write(f'    повтор: {sql[:120]}')
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+        return failed
+
+    def handle(self, *args, **options):
+        failed = []
+        # Замеры очищают кэш, а build_dataset меняет версии в нём:
+        # общий кэш приложения на время замера подменяется локальным.
+        with override_settings(CACHES=BENCHMARK_CACHES):
+            for size in options['sizes']:
+                failed += self.benchmark(size, options)
+        if failed:
+            raise CommandError(
+                'Превышен бюджет запросов: ' + ', '.join(failed)
+            )
+        return 'Все эндпоинты уложились в бюджет запросов'
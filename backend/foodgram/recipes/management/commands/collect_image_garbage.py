@@ -0,0 +1,70 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+
+IMAGES_DIR = 'recipes'
+MIN_AGE = 60 * 60
+
+
+def scan_files(path):
+    '''Обход дерева файлов через os.scandir без построения списка.'''
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+def get_referenced_names():
+    names = set()
+    rows = Recipe.objects.values_list('image', 'image_variants')
+    for image, variants in rows.iterator():
+        names.add(image)
+        if variants:
+            names.update(json.loads(variants).values())
+    return names
+
+
+class Command(BaseCommand):
+    help = ('Удаление файлов изображений рецептов, на которые '
+            'не ссылается ни один рецепт')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать файлы, подлежащие удалению'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=MIN_AGE,
+            help='Не удалять файлы моложе указанного числа секунд'
+        )
+
+    def handle(self, *args, **options):
+        root = os.path.join(settings.MEDIA_ROOT, IMAGES_DIR)
+        if not os.path.isdir(root):
+            return 'Файлов изображений нет'
+        referenced = get_referenced_names()
+        deadline = time.time() - options['min_age']
+        count = size = 0
+        for entry in scan_files(root):
+            name = os.path.relpath(entry.path, settings.MEDIA_ROOT).replace(
+                os.sep, '/'
+            )
+            stat = entry.stat(follow_symlinks=False)
+            if name in referenced or stat.st_mtime > deadline:
+                continue
+            count += 1
+            size += stat.st_size
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                os.remove(entry.path)
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        return f'{action} файлов: {count}, {size / 1024 / 1024:.1f} МБ'
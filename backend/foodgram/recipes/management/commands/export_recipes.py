@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from ._dataset import (BATCH_SIZE, FORMATS, SECTIONS, get_format, open_output,
+                       write_csv, write_ndjson)
+
+
+class Command(BaseCommand):
+    help = ('Выгрузка рецептов со связанными данными: пользователи, тэги, '
+            'ингредиенты, избранное, списки покупок и подписки. NDJSON '
+            'пишется в один файл, CSV — в каталог, по файлу на таблицу')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл NDJSON (- для вывода в stdout) или каталог CSV'
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат выгрузки, по умолчанию определяется по пути'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Количество строк, читаемых из базы за один раз'
+        )
+        parser.add_argument(
+            '--with-passwords', action='store_true',
+            help='Выгрузить хэши паролей пользователей'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        arguments = (
+            SECTIONS, options['batch_size'], options['with_passwords']
+        )
+        if get_format(path, options['format']) == 'csv':
+            counts = write_csv(path, *arguments)
+        else:
+            with open_output(path) as file:
+                counts = write_ndjson(file, *arguments)
+        self.stderr.write(', '.join(
+            f'{section.name}: {counts[section.name]}' for section in SECTIONS
+        ))
@@ -0,0 +1,269 @@
+import json
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate
+from random import Random
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+from recipes.models import (Favourites, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingList, Tag, TagRecipe)
+from recipes.storage import recipe_image_storage
+from recipes.tasks import render_variants
+from users.models import CustomUser, SubscribeModel
+
+from ._dataset import (BATCH_SIZE, get_next_id, insert_rows,
+                       refresh_derived_data, reset_sequences)
+
+GENERATED_EMAIL_DOMAIN = 'generated.foodgram.ru'
+DEFAULT_PASSWORD = 'generated-password'
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Сергей', 'Елена',
+               'Дмитрий', 'Наталья', 'Алексей')
+LAST_NAMES = ('Иванова', 'Смирнов', 'Кузнецова', 'Попов', 'Соколова',
+              'Лебедев', 'Козлова', 'Новиков', 'Морозова', 'Волков')
+DISH_ADJECTIVES = ('Домашний', 'Быстрый', 'Летний', 'Пряный', 'Лёгкий',
+                   'Сытный', 'Бабушкин', 'Праздничный', 'Острый', 'Нежный')
+DISHES = ('суп', 'салат', 'пирог', 'омлет', 'плов', 'рагу', 'гуляш',
+          'десерт', 'соус', 'кекс', 'борщ', 'ризотто')
+TEXT_SENTENCES = (
+    'Подготовьте все ингредиенты заранее.',
+    'Нарежьте овощи небольшими кубиками.',
+    'Разогрейте сковороду и добавьте масло.',
+    'Готовьте на среднем огне, периодически помешивая.',
+    'Посолите и поперчите по вкусу.',
+    'Дайте блюду настояться несколько минут.',
+    'Подавайте горячим, украсив зеленью.',
+)
+AMOUNTS = (1, 2, 3, 5, 10, 30, 50, 100, 150, 200, 250, 300, 500)
+TAGS_PER_RECIPE_WEIGHTS = (5, 3, 1)
+INGREDIENTS_PER_RECIPE = (3, 12)
+PUBLICATION_PERIOD_DAYS = 365
+# Популярность авторов, рецептов и ингредиентов распределена по закону
+# Ципфа: небольшая часть записей получает большую часть обращений.
+ZIPF_EXPONENT = 0.9
+IMAGE_SIZE = (1280, 960)
+
+
+class Sampler:
+    '''Выбор значений с весами по закону Ципфа в случайном порядке.'''
+
+    def __init__(self, random, values):
+        self.random = random
+        self.values = list(values)
+        random.shuffle(self.values)
+        self.cum_weights = list(accumulate(
+            1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(len(values))
+        ))
+
+    def choices(self, count):
+        return self.random.choices(
+            self.values, cum_weights=self.cum_weights, k=count
+        )
+
+    def sample(self, count):
+        '''
+        count различных значений (не больше, чем есть). При выборке
+        большей части значений веса не учитываются.
+        '''
+        count = min(count, len(self.values))
+        if count > len(self.values) // 2:
+            return self.random.sample(self.values, count)
+        result = {}
+        while len(result) < count:
+            result.update(dict.fromkeys(self.choices(count - len(result))))
+        return list(result)
+
+
+class Command(BaseCommand):
+    help = ('Создание синтетических пользователей, рецептов, избранного, '
+            'списков покупок и подписок для нагрузочного тестирования. '
+            'Ингредиенты берутся из каталога, загруженного в базу')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=100,
+            help='Количество пользователей'
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=1000,
+            help='Количество рецептов'
+        )
+        parser.add_argument(
+            '--favourites', type=int, default=20,
+            help='Среднее количество рецептов в избранном пользователя'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Среднее количество рецептов в списке покупок'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Среднее количество подписок пользователя'
+        )
+        parser.add_argument(
+            '--password', default=DEFAULT_PASSWORD,
+            help='Пароль создаваемых пользователей'
+        )
+        parser.add_argument(
+            '--seed', type=int,
+            help='Начальное значение генератора случайных чисел'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Количество строк в одном запросе к базе'
+        )
+
+    def write(self, model, rows, flush=False):
+        '''
+        Накопление строк и запись пачками. Размер таблицы запоминается
+        до первой записи: строки, пропущенные из-за конфликтов,
+        не попадают в отчёт.
+        '''
+        if model not in self.batches:
+            self.before[model] = model.objects.count()
+        batch = self.batches.setdefault(model, [])
+        batch.extend(rows)
+        if flush or len(batch) >= self.batch_size:
+            insert_rows(model, batch)
+            batch.clear()
+
+    def flush(self):
+        for model in list(self.batches):
+            self.write(model, [], flush=True)
+
+    def get_count(self, average):
+        return self.random.randint(0, 2 * average) if average > 0 else 0
+
+    def create_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_image(self):
+        '''
+        Общее изображение рецептов: сохраняется один раз, уменьшенные
+        копии создаются сразу.
+        '''
+        buffer = BytesIO()
+        Image.new('RGB', IMAGE_SIZE, '#E26C2D').save(buffer, 'PNG')
+        name = recipe_image_storage.save(
+            'recipes/generated.png', ContentFile(buffer.getvalue())
+        )
+        variants = render_variants(name)
+        return name, json.dumps({'source': name, **variants})
+
+    def create_users(self, count, password):
+        first_id = get_next_id(CustomUser)
+        password = make_password(password)
+        for user_id in range(first_id, first_id + count):
+            self.write(CustomUser, [dict(
+                id=user_id,
+                email=f'user{user_id}@{GENERATED_EMAIL_DOMAIN}',
+                username=f'user{user_id}',
+                first_name=self.random.choice(FIRST_NAMES),
+                last_name=self.random.choice(LAST_NAMES),
+                password=password
+            )])
+        return list(range(first_id, first_id + count))
+
+    def create_recipes(self, count, authors, tags, ingredients):
+        image, image_variants = self.create_image()
+        now = timezone.now()
+        first_id = get_next_id(Recipe)
+        for recipe_id in range(first_id, first_id + count):
+            self.write(Recipe, [dict(
+                id=recipe_id,
+                author_id=authors.choices(1)[0],
+                name=(f'{self.random.choice(DISH_ADJECTIVES)} '
+                      f'{self.random.choice(DISHES)}'),
+                pub_date=now - timedelta(
+                    seconds=self.random.randint(
+                        0, PUBLICATION_PERIOD_DAYS * 24 * 60 * 60
+                    )
+                ),
+                image=image,
+                image_variants=image_variants,
+                text=' '.join(self.random.sample(TEXT_SENTENCES, 4)),
+                cooking_time=min(max(
+                    int(self.random.lognormvariate(3.3, 0.6)), 1
+                ), 600)
+            )])
+            tags_count = self.random.choices(
+                range(1, len(TAGS_PER_RECIPE_WEIGHTS) + 1),
+                weights=TAGS_PER_RECIPE_WEIGHTS
+            )[0]
+            self.write(TagRecipe, [
+                dict(tag_id=tag_id, recipe_id=recipe_id)
+                for tag_id in self.random.sample(
+                    tags, min(tags_count, len(tags))
+                )
+            ])
+            self.write(IngredientRecipe, [
+                dict(ingredient_id=ingredient_id, recipe_id=recipe_id,
+                     amount=self.random.choice(AMOUNTS))
+                for ingredient_id in ingredients.sample(
+                    self.random.randint(*INGREDIENTS_PER_RECIPE)
+                )
+            ])
+        return list(range(first_id, first_id + count))
+
+    def create_relations(self, users, recipes, authors, options):
+        '''Избранное, списки покупок и подписки пользователей.'''
+        for user_id in users:
+            for model, average in ((Favourites, options['favourites']),
+                                   (ShoppingList, options['cart'])):
+                self.write(model, [
+                    dict(user_id=user_id, recipe_id=recipe_id)
+                    for recipe_id in recipes.sample(self.get_count(average))
+                ])
+            self.write(SubscribeModel, [
+                dict(author_id=author_id, follower_id=user_id)
+                for author_id in authors.sample(
+                    self.get_count(options['subscriptions'])
+                ) if author_id != user_id
+            ])
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['recipes']) < 1:
+            raise CommandError(
+                'Количество пользователей и рецептов должно быть больше нуля'
+            )
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredient_ids:
+            raise CommandError(
+                'Каталог ингредиентов пуст: выполните load_csv_ingredients'
+            )
+        self.random = Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.batches = {}
+        self.before = {}
+        with transaction.atomic():
+            tags = self.create_tags()
+            users = self.create_users(options['users'], options['password'])
+            self.flush()
+            authors = Sampler(self.random, users)
+            recipes = Sampler(self.random, self.create_recipes(
+                options['recipes'], authors, tags,
+                Sampler(self.random, ingredient_ids)
+            ))
+            self.flush()
+            self.create_relations(users, recipes, authors, options)
+            self.flush()
+            reset_sequences([CustomUser, Recipe])
+            refresh_derived_data()
+        for model, count in self.before.items():
+            self.stdout.write(
+                f'{model.__name__}: {model.objects.count() - count}'
+            )
@@ -0,0 +1,55 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ._dataset import (BATCH_SIZE, FORMATS, SECTIONS, Importer, get_format,
+                       read_csv, read_ndjson, refresh_derived_data)
+
+
+class Command(BaseCommand):
+    help = ('Загрузка рецептов со связанными данными, выгруженных командой '
+            'export_recipes. Пользователи, тэги и ингредиенты сопоставляются '
+            'с существующими, рецепты добавляются с новыми id. Загрузка '
+            'выполняется в одной транзакции')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл NDJSON (- для чтения из stdin) или каталог CSV'
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат данных, по умолчанию определяется по пути'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Количество строк в одном запросе к базе'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть больше нуля')
+        if get_format(path, options['format']) == 'csv':
+            if not os.path.isdir(path):
+                raise CommandError(f'Каталог {path} не найден')
+            records = read_csv(path)
+        else:
+            records = read_ndjson(path)
+        importer = Importer(
+            options['batch_size'],
+            self.stdout if options['verbosity'] > 1 else None
+        )
+        try:
+            with transaction.atomic():
+                counts = importer.run(records)
+                refresh_derived_data(importer.matched_users)
+        except FileNotFoundError:
+            raise CommandError(f'Файл {path} не найден')
+        for section in SECTIONS:
+            section_counts = counts[section.name]
+            self.stdout.write(
+                f'{section.name}: добавлено {section_counts["inserted"]}, '
+                f'найдено {section_counts["matched"]}, '
+                f'пропущено {section_counts["skipped"]}'
+            )
@@ -1,38 +1,183 @@
 import csv
+import json
 from pathlib import Path
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db import IntegrityError
+from recipes import cache
 from recipes.models import Ingredient
 
+FORMATS = ('csv', 'json')
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+SEPARATORS = ' \t\r\n,'
+
+
+def read_csv(file):
+    for row in csv.reader(file, delimiter=',', skipinitialspace=True):
+        if row:
+            yield row
+
+
+def decode_items(decoder, buffer):
+    '''
+    Разбор полностью прочитанных элементов массива. Возвращает
+    элементы и позицию, с которой начинается неразобранный остаток.
+    '''
+    items = []
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in SEPARATORS:
+            position += 1
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except ValueError:
+            return items, position
+        if isinstance(item, dict):
+            item = [item.get('name'), item.get('measurement_unit')]
+        items.append(item)
+
+
+def read_json(file):
+    '''
+    Потоковое чтение массива JSON: объекты разбираются по мере
+    чтения файла, весь файл в память не загружается.
+    '''
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer:
+        return
+    if not buffer.startswith('['):
+        raise CommandError('Файл JSON должен содержать массив')
+    buffer = buffer[1:]
+    while True:
+        chunk = file.read(CHUNK_SIZE)
+        buffer += chunk
+        items, position = decode_items(decoder, buffer)
+        yield from items
+        buffer = buffer[position:]
+        if not chunk:
+            break
+    if buffer.strip() != ']':
+        raise CommandError('Ошибка в данных: некорректный JSON')
+
+
+def clean_row(row):
+    '''Проверка строки. Возвращает пару значений или None.'''
+    if not isinstance(row, (list, tuple)) or len(row) != 2:
+        return None
+    name, measurement_unit = (
+        str(value).strip() if value is not None else '' for value in row
+    )
+    fields = Ingredient._meta
+    if not name or not measurement_unit or (
+        len(name) > fields.get_field('name').max_length
+    ) or len(measurement_unit) > fields.get_field(
+        'measurement_unit'
+    ).max_length:
+        return None
+    return name, measurement_unit
+
 
 class Command(BaseCommand):
-    help = ('Класс для автоматического заполненеия данных об ингредиентах,'
-            'Из CSV файла расположенного в папке data на уровне проекта'
+    help = ('Загрузка ингредиентов из файла CSV или JSON '
+            '(по умолчанию data/ingredients.csv). Существующие '
+            'ингредиенты пропускаются')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=Path(settings.BASE_DIR, 'data', 'ingredients.csv'),
+            help='Путь к файлу с ингредиентами'
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла, по умолчанию определяется по расширению'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Количество строк в одном запросе к базе'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Показать изменения без записи в базу'
+        )
+
+    def get_format(self, path, options):
+        file_format = options['format'] or Path(path).suffix[1:].lower()
+        if file_format not in FORMATS:
+            raise CommandError(
+                'Не удалось определить формат файла, укажите --format'
             )
+        return file_format
+
+    def load_batch(self, batch):
+        '''Запись пачки строк. Возвращает число добавленных.'''
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in batch}
+        ).values_list('name', 'measurement_unit'))
+        new = [row for row in dict.fromkeys(batch)
+               if row not in existing and row not in self.planned]
+        if self.verbosity > 1:
+            for name, measurement_unit in new:
+                self.stdout.write(f'+ {name}, {measurement_unit}')
+        if self.dry_run:
+            # Без записи повторы из следующих пачек нужно отсеять самим.
+            self.planned.update(new)
+        else:
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=measurement_unit)
+                 for name, measurement_unit in new),
+                ignore_conflicts=True
+            )
+        return len(new)
+
+    def load(self, file, read, batch_size):
+        '''Загрузка строк пачками. Возвращает счётчики строк.'''
+        total = inserted = rejected = 0
+        batch = []
+        for total, row in enumerate(read(file), 1):
+            cleaned = clean_row(row)
+            if cleaned is None:
+                rejected += 1
+                self.stderr.write(f'Ошибка в данных: строка №{total}')
+            else:
+                batch.append(cleaned)
+            if total % batch_size == 0:
+                if batch:
+                    inserted += self.load_batch(batch)
+                batch = []
+                if self.verbosity:
+                    self.stdout.write(f'Обработано строк: {total}')
+        if batch:
+            inserted += self.load_batch(batch)
+        if total % batch_size and self.verbosity:
+            self.stdout.write(f'Обработано строк: {total}')
+        return total, inserted, rejected
 
     def handle(self, *args, **options):
-        path_to = Path(settings.BASE_DIR, 'data', 'ingredients.csv')
+        path = options['path']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('Размер пачки должен быть больше нуля')
+        read = read_csv if self.get_format(path, options) == 'csv' else (
+            read_json
+        )
+        self.verbosity = options['verbosity']
+        self.dry_run = options['dry_run']
+        self.planned = set()
         try:
-            with open(path_to, 'r', encoding='UTF-8') as f:
-                data = csv.DictReader(f, delimiter=',',
-                                      skipinitialspace=True)
-                has_rows = False
-                for row in data:
-                    has_rows = True
-                    try:
-                        row_list = list(row.values())
-                        Ingredient.objects.get_or_create(
-                            name=row_list[0],
-                            measurement_unit=row_list[1]
-                        )
-                    except IntegrityError:
-                        print(row)
-                        return ('Ошибка в данных: '
-                                f'строка №{data.line_num - 1}')
-                if not has_rows:
-                    return 'Файл пуст'
+            with open(path, 'r', encoding='UTF-8') as file:
+                total, inserted, rejected = self.load(file, read, batch_size)
         except FileNotFoundError:
-            raise CommandError('Файл отсутствует в директории data')
-        return 'Данные обновлены'
+            raise CommandError(f'Файл {path} не найден')
+        except UnicodeDecodeError:
+            raise CommandError('Файл должен быть в кодировке UTF-8')
+        if not total:
+            return 'Файл пуст'
+        if inserted and not self.dry_run:
+            cache.bump_on_commit(cache.INGREDIENTS_VERSION)
+        skipped = total - inserted - rejected
+        prefix = 'Проверка без записи. ' if self.dry_run else ''
+        return (f'{prefix}Добавлено: {inserted}, пропущено: {skipped}, '
+                f'отклонено: {rejected}')
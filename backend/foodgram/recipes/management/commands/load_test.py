@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.loadtest import format_report, run_load_test
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import CustomUser
+
+from .generate_data import DEFAULT_PASSWORD, GENERATED_EMAIL_DOMAIN
+
+SAMPLE_SIZE = 10000
+PREFIX_LENGTH = 3
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочное тестирование запущенного сервера смесью запросов '
+            'SPA от имени пользователей, созданных командой generate_data. '
+            'Выводит число запросов, ошибок, пропускную способность '
+            'и процентили задержки по эндпоинтам')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://localhost:8000',
+            help='Адрес сервера'
+        )
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Длительность теста в секундах'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Количество одновременных пользователей'
+        )
+        parser.add_argument(
+            '--password', default=DEFAULT_PASSWORD,
+            help='Пароль пользователей, созданных generate_data'
+        )
+        parser.add_argument(
+            '--seed', type=int,
+            help='Начальное значение генератора случайных чисел'
+        )
+
+    def get_data(self):
+        '''Идентификаторы для запросов берутся из базы сервера.'''
+        return {
+            'recipes': list(
+                Recipe.objects.values_list('id', flat=True)[:SAMPLE_SIZE]
+            ),
+            'authors': list(CustomUser.objects.filter(
+                recipes_count__gt=0
+            ).values_list('id', flat=True)[:SAMPLE_SIZE]),
+            'tags': list(Tag.objects.values_list('slug', flat=True)),
+            'prefixes': sorted({
+                name[:PREFIX_LENGTH] for name in
+                Ingredient.objects.values_list('name', flat=True)[:SAMPLE_SIZE]
+            }),
+        }
+
+    def handle(self, *args, **options):
+        emails = list(CustomUser.objects.filter(
+            email__endswith=f'@{GENERATED_EMAIL_DOMAIN}', is_blocked=False
+        ).order_by('id').values_list(
+            'email', flat=True
+        )[:options['concurrency']])
+        data = self.get_data()
+        if not emails or not all(data.values()):
+            raise CommandError('Нет данных для теста: выполните generate_data')
+        self.stdout.write(
+            f'Пользователей: {len(emails)}, '
+            f'длительность: {options["duration"]} с'
+        )
+        try:
+            results, elapsed = run_load_test(
+                options['url'],
+                [(email, options['password']) for email in emails],
+                data, options['duration'], options['seed']
+            )
+        except RuntimeError as error:
+            raise CommandError(error)
+        self.stdout.write(format_report(results, elapsed))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.tasks import make_variants
+
+
+class Command(BaseCommand):
+    help = ('Создание уменьшенных копий изображений рецептов, '
+            'для которых они ещё не готовы')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать копии для всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        made = failed = 0
+        recipes = Recipe.objects.exclude(image='').only(
+            'id', 'image', 'image_variants'
+        )
+        for recipe in recipes.iterator():
+            if recipe.variants and not options['all']:
+                continue
+            try:
+                make_variants(recipe.id, recipe.image.name)
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f'{recipe.image.name}: {error}')
+            else:
+                made += 1
+        return f'Обработано изображений: {made}, ошибок: {failed}'
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from recipes.counters import rebuild_shopping_totals
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт итогов списков покупок всех пользователей '
+            'по текущему содержимому списков и рецептов')
+
+    def handle(self, *args, **options):
+        created = rebuild_shopping_totals()
+        return f'Итоги списков покупок пересчитаны: {created} записей'
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from recipes import cache
+from recipes.counters import recount
+
+
+class Command(BaseCommand):
+    help = ('Сверка счётчиков избранного, рецептов и подписчиков '
+            'с фактическими данными и исправление расхождений')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, не исправляя их'
+        )
+
+    def handle(self, *args, **options):
+        drift = recount(fix=not options['dry_run'])
+        for name, count in drift.items():
+            self.stdout.write(f'{name}: расхождений {count}')
+        if options['dry_run'] or not any(drift.values()):
+            return 'Счётчики не изменены'
+        cache.invalidate_counters()
+        return 'Счётчики обновлены'
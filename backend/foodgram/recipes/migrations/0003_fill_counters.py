@@ -0,0 +1,39 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_related(related_model, related_field):
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{related_field: OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    recipe = apps.get_model('recipes', 'Recipe')
+    favourites = apps.get_model('recipes', 'Favourites')
+    user = apps.get_model('users', 'CustomUser')
+    subscribe = apps.get_model('users', 'SubscribeModel')
+    recipe.objects.update(
+        favourites_count=count_related(favourites, 'recipe')
+    )
+    user.objects.update(
+        recipes_count=count_related(recipe, 'author'),
+        followers_count=count_related(subscribe, 'author')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_recipe_favourites_count'),
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
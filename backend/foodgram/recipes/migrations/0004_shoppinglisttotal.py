@@ -0,0 +1,60 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+BATCH_SIZE = 1000
+
+
+def fill_shopping_totals(apps, schema_editor):
+    ingredient_recipe = apps.get_model('recipes', 'IngredientRecipe')
+    total_model = apps.get_model('recipes', 'ShoppingListTotal')
+    totals = ingredient_recipe.objects.filter(
+        recipe__shoppinglist__isnull=False
+    ).values(
+        'recipe__shoppinglist__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by().values_list(
+        'recipe__shoppinglist__user_id', 'ingredient_id', 'total'
+    )
+    batch = []
+    for user_id, ingredient_id, amount in totals.iterator():
+        batch.append(total_model(
+            user_id=user_id, ingredient_id=ingredient_id, amount=amount
+        ))
+        if len(batch) == BATCH_SIZE:
+            total_model.objects.bulk_create(batch)
+            batch = []
+    total_model.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0003_fill_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListTotal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Общее количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_totals', to='recipes.Ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_totals', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог списка покупок',
+                'verbose_name_plural': 'Итоги списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglisttotal',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_total'),
+        ),
+        migrations.RunPython(
+            fill_shopping_totals, migrations.RunPython.noop
+        ),
+    ]
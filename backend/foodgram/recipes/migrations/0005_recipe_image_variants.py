@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_shoppinglisttotal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Уменьшенные копии изображения'),
+        ),
+    ]
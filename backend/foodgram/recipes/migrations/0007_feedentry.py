@@ -0,0 +1,69 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:34
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def fill_feed(apps, schema_editor):
+    recipe = apps.get_model('recipes', 'Recipe')
+    feed_entry = apps.get_model('recipes', 'FeedEntry')
+    subscribe = apps.get_model('users', 'SubscribeModel')
+    followers = defaultdict(list)
+    subscriptions = subscribe.objects.filter(
+        author__followers_count__lt=getattr(
+            settings, 'FEED_FANOUT_LIMIT', 1000
+        )
+    ).values_list('author_id', 'follower_id')
+    for author_id, follower_id in subscriptions.iterator():
+        followers[author_id].append(follower_id)
+    recipes = recipe.objects.filter(
+        author_id__in=subscriptions.values('author_id')
+    ).values_list('id', 'author_id')
+    batch = []
+    for recipe_id, author_id in recipes.iterator():
+        for user_id in followers[author_id]:
+            batch.append(feed_entry(
+                user_id=user_id, recipe_id=recipe_id, author_id=author_id
+            ))
+        if len(batch) >= BATCH_SIZE:
+            feed_entry.objects.bulk_create(batch)
+            batch = []
+    feed_entry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0006_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.Recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', 'author'], name='feed_entry_user_author'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_entry'),
+        ),
+        migrations.RunPython(fill_feed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,119 @@
+from hashlib import md5
+
+from django.http import Http404
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import cache
+
+CONDITIONAL_METHODS = ('GET', 'HEAD')
+
+
+class SharedCacheMixin:
+    '''
+    Выдача списка и страницы объекта из общего кэша
+    с подстановкой флагов текущего пользователя.
+    Представление должно реализовать метод serialize_shared(ids).
+    '''
+    page_fields = ('id',)
+    page_versions = (cache.RECIPES_VERSION,)
+
+    def get_page_versions(self, request):
+        return self.page_versions
+
+    def list(self, request, *args, **kwargs):
+        if not cache.is_enabled():
+            return super().list(request, *args, **kwargs)
+        cacheable = not any(
+            request.query_params.get(flag) for flag in cache.USER_FLAGS
+        )
+        versions = self.get_page_versions(request)
+        page = cache.get_page(request, versions) if cacheable else None
+        if page is None:
+            queryset = self.filter_queryset(
+                self.queryset.only(*self.page_fields)
+            )
+            ids = [obj.id for obj in self.paginate_queryset(queryset)]
+            page = self.get_paginated_response(ids).data
+            if cacheable:
+                cache.set_page(request, page, versions)
+        objects = cache.get_shared_recipes(
+            page['results'], self.serialize_shared, request
+        )
+        return Response(
+            {**page, 'results': cache.overlay_user_flags(
+                objects, request.user
+            )}
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not cache.is_enabled() or request.query_params:
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            pk = int(kwargs[self.lookup_field])
+        except ValueError:
+            raise Http404
+        objects = cache.get_shared_recipes(
+            [pk], self.serialize_shared, request
+        )
+        if not objects:
+            raise Http404
+        return Response(cache.overlay_user_flags(objects, request.user)[0])
+
+
+class ConditionalGetMixin:
+    '''
+    Условные GET-запросы (If-None-Match) для списка и страницы объекта.
+    ETag вычисляется по версиям таблиц из etag_versions
+    без обращения к базе и без сериализации данных.
+    '''
+    etag_versions = ()
+    etag_per_user = False
+
+    def get_etag_versions(self, request):
+        return self.etag_versions
+
+    def get_etag(self, request):
+        names = list(self.get_etag_versions(request))
+        parts = []
+        if self.etag_per_user and request.user.is_authenticated:
+            names.append(cache.get_user_version(request.user.id))
+            parts.append(str(request.user.id))
+        parts = [*map(str, cache.get_versions(*names)), *parts]
+        parts += [request.get_full_path(), request.accepted_media_type]
+        return '"{}"'.format(md5('|'.join(parts).encode()).hexdigest())
+
+    def get_conditional_response(self, handler, request, *args, **kwargs):
+        if request.method not in CONDITIONAL_METHODS:
+            return handler(request, *args, **kwargs)
+        etag = self.get_etag(request)
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+            # '*' совпадает только с существующим объектом.
+            if (
+                '*' in if_none_match
+                and response.status_code == status.HTTP_200_OK
+            ):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        if response.status_code in (
+            status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED
+        ):
+            response['ETag'] = etag
+            if self.etag_per_user:
+                patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -1,12 +1,21 @@
+import json
+import time
+
+from django.conf import settings
 from django.core import validators
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models.expressions import Window
+from django.db.models.functions import Greatest, RowNumber
 from django.urls import reverse
-from users.models import CustomUser
+from users.models import CustomUser, SubscribeModel
+
+from .storage import recipe_image_storage
 
 MIN_TIME_LIMIT = 'Время приготовления не может быть меньше 1-й минуты'
 VALUE_MIN_TIME_LIMIT = 1
 MIN_AMOUNT_LIMIT = 'Количество ингредиента не может быть мень 1'
 VALUE_MIN_AMOUNT_LIMIT = 1
+RECIPE_FIELDS = ('name', 'image', 'image_variants', 'cooking_time')
 
 
 class Tag(models.Model):
@@ -42,6 +51,78 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'amount',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            )
+        )
+
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()
+                )
+            )
+        return self.annotate(
+            is_favorited=models.Exists(Favourites.objects.filter(
+                user=user, recipe=models.OuterRef('pk')
+            )),
+            is_in_shopping_cart=models.Exists(ShoppingList.objects.filter(
+                user=user, recipe=models.OuterRef('pk')
+            ))
+        )
+
+    def feed(self, user):
+        '''
+        Рецепты авторов, на которых подписан пользователь: из ленты
+        пользователя и, для авторов с большим числом подписчиков,
+        рецепты которых в ленты не рассылаются, — напрямую.
+        '''
+        entries = FeedEntry.objects.filter(user=user).values('recipe_id')
+        popular = SubscribeModel.objects.filter(
+            follower=user,
+            author__followers_count__gte=settings.FEED_FANOUT_LIMIT
+        ).values('author_id')
+        return self.filter(
+            models.Q(id__in=entries) | models.Q(author_id__in=popular)
+        )
+
+    def first_per_author(self, author_ids, limit=None, fields=RECIPE_FIELDS):
+        '''
+        Первые limit рецептов каждого из авторов одним запросом:
+        нумерация строк ROW_NUMBER() в разрезе автора.
+        '''
+        recipes = self.filter(author_id__in=author_ids)
+        ordering = self.model._meta.ordering
+        if limit is None:
+            return recipes.only(*fields).order_by('author_id', *ordering)
+        ranked = recipes.order_by().annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=[models.F('author_id')],
+                order_by=[
+                    models.F(field[1:]).desc() if field.startswith('-')
+                    else models.F(field).asc()
+                    for field in ordering
+                ]
+            )
+        ).values('id', 'author_id', 'row_number', *fields)
+        sql, params = ranked.query.sql_with_params()
+        return self.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+            'ORDER BY author_id, row_number',
+            (*params, limit)
+        )
+
+
 class Recipe(models.Model):
     tags = models.ManyToManyField(
         Tag,
@@ -68,7 +149,9 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         'Изображение бллюда',
-        upload_to='recipes/%Y/%m/%d/'
+        upload_to='recipes/',
+        storage=recipe_image_storage,
+        db_index=True
     )
     text = models.TextField('Описание рецепта')
     cooking_time = models.PositiveSmallIntegerField(
@@ -78,6 +161,19 @@ class Recipe(models.Model):
             message=MIN_TIME_LIMIT)
         ]
     )
+    favourites_count = models.PositiveIntegerField(
+        'Добавлений в избранное',
+        default=0,
+        db_index=True
+    )
+    image_variants = models.TextField(
+        'Уменьшенные копии изображения',
+        blank=True,
+        default='',
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date', 'name']
@@ -87,6 +183,26 @@ class Recipe(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'image' in field_names:
+            instance.loaded_image = values[field_names.index('image')]
+        return instance
+
+    @property
+    def variants(self):
+        '''
+        Готовые уменьшенные копии текущего изображения:
+        {название варианта: путь в хранилище}.
+        '''
+        if not self.image_variants:
+            return {}
+        variants = json.loads(self.image_variants)
+        if variants.pop('source', None) != self.image.name:
+            return {}
+        return variants
+
     def get_absolute_url(self):
         return reverse('recipes:recipes-detail', kwargs={'pk': self.pk})
 
@@ -144,6 +260,30 @@ class IngredientRecipe(models.Model):
         ]
 
 
+class UserRecipeQuerySet(models.QuerySet):
+    def add_missing(self, user_id, recipe_ids):
+        '''
+        Добавление рецептов пользователю одним запросом INSERT ... ON
+        CONFLICT DO NOTHING. Возвращает id рецептов, добавленных этим
+        запросом: уже добавленные, в том числе параллельно, пропускаются.
+        Сигналы не отправляются.
+        '''
+        if not recipe_ids:
+            return []
+        quote = connection.ops.quote_name
+        rows = ', '.join(['(%s, %s)'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(self.model._meta.db_table)} '
+                f'(user_id, recipe_id) VALUES {rows} '
+                f'ON CONFLICT (user_id, recipe_id) DO NOTHING '
+                f'RETURNING recipe_id',
+                [value for pk in recipe_ids for value in (user_id, pk)]
+            )
+            added = {pk for pk, in cursor.fetchall()}
+        return [pk for pk in recipe_ids if pk in added]
+
+
 class Favourites(models.Model):
     user = models.ForeignKey(
         CustomUser,
@@ -158,6 +298,8 @@ class Favourites(models.Model):
         verbose_name='Рецепт'
     )
 
+    objects = UserRecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = "Избранное"
@@ -186,6 +328,8 @@ class ShoppingList(models.Model):
         verbose_name='Рецепт'
     )
 
+    objects = UserRecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Список покупок'
         verbose_name_plural = "Список покупок"
@@ -198,3 +342,201 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f'{self.user} {self.recipe}'
+
+
+class ShoppingListTotalQuerySet(models.QuerySet):
+    def increase(self, deltas, user_id=None, recipe_id=None):
+        '''
+        Увеличение итогов одним запросом INSERT ... ON CONFLICT DO UPDATE:
+        пользователя user_id или всех, у кого рецепт recipe_id в списке
+        покупок. Отсутствующие итоги создаются, одновременные добавления
+        одного ингредиента не конфликтуют.
+        '''
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        rows = ' UNION ALL '.join(
+            ['SELECT %s AS ingredient_id, %s AS amount'] * len(deltas)
+        )
+        params = [value for delta in deltas for value in delta]
+        if recipe_id is None:
+            source = (f'SELECT %s, delta.ingredient_id, delta.amount '
+                      f'FROM ({rows}) delta WHERE 1 = 1')
+            params.insert(0, user_id)
+        else:
+            source = (f'SELECT cart.user_id, delta.ingredient_id, '
+                      f'delta.amount '
+                      f'FROM {quote(ShoppingList._meta.db_table)} cart '
+                      f'CROSS JOIN ({rows}) delta WHERE cart.recipe_id = %s')
+            params.append(recipe_id)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, ingredient_id, amount) '
+                f'{source} ON CONFLICT (user_id, ingredient_id) '
+                f'DO UPDATE SET amount = {table}.amount + EXCLUDED.amount',
+                params
+            )
+
+    def decrease(self, deltas):
+        '''Уменьшение итогов одним запросом, обнулённые удаляются.'''
+        totals = self.filter(
+            ingredient_id__in=[ingredient_id for ingredient_id, _ in deltas]
+        )
+        totals.update(amount=Greatest(
+            models.F('amount') + models.Case(
+                *(models.When(ingredient_id=ingredient_id, then=delta)
+                  for ingredient_id, delta in deltas),
+                output_field=models.IntegerField()
+            ), 0, output_field=models.IntegerField()
+        ))
+        totals.filter(amount=0).delete()
+
+    def apply_deltas(self, deltas, user_id=None, recipe_id=None):
+        # Строки меняются в порядке ингредиентов: одновременные
+        # транзакции блокируют их в одном порядке.
+        deltas = sorted(
+            (ingredient_id, delta)
+            for ingredient_id, delta in deltas.items() if delta
+        )
+        increased = [(pk, delta) for pk, delta in deltas if delta > 0]
+        decreased = [(pk, delta) for pk, delta in deltas if delta < 0]
+        if recipe_id is None:
+            totals = self.filter(user_id=user_id)
+        else:
+            carts = ShoppingList.objects.filter(recipe_id=recipe_id)
+            if not deltas or not carts.exists():
+                return
+            totals = self.filter(user_id__in=carts.values('user_id'))
+        with transaction.atomic():
+            if increased:
+                self.increase(increased, user_id, recipe_id)
+            if decreased:
+                totals.decrease(decreased)
+
+    def apply(self, user_id, deltas):
+        self.apply_deltas(deltas, user_id=user_id)
+
+    def add_recipes(self, user_id, recipe_ids, sign=1):
+        amounts = IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values('ingredient_id').annotate(
+            total=models.Sum('amount')
+        ).values_list('ingredient_id', 'total')
+        self.apply(user_id, {
+            ingredient_id: sign * total for ingredient_id, total in amounts
+        })
+
+    def remove_recipes(self, user_id, recipe_ids):
+        self.add_recipes(user_id, recipe_ids, sign=-1)
+
+    def apply_recipe_change(self, recipe_id, deltas):
+        '''
+        Изменение ингредиентов рецепта в итогах всех пользователей,
+        добавивших его в список покупок: по запросу на все увеличения
+        и на все уменьшения.
+        '''
+        self.apply_deltas(deltas, recipe_id=recipe_id)
+
+
+class ShoppingListTotal(models.Model):
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='shopping_totals',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_totals',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField('Общее количество')
+
+    objects = ShoppingListTotalQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_total'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.ingredient} {self.amount}'
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_entry_user_author'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.recipe}'
+
+
+class DataVersionQuerySet(models.QuerySet):
+    def get_values(self, names):
+        '''Версии по названиям, для отсутствующих в базе — 0.'''
+        return {
+            **dict.fromkeys(names, 0),
+            **dict(self.filter(name__in=names).values_list('name', 'value')),
+        }
+
+    def bump(self, name):
+        value = time.time_ns()
+        if not self.filter(name=name).update(value=value):
+            self.get_or_create(name=name, defaults={'value': value})
+        return value
+
+
+class DataVersion(models.Model):
+    '''
+    Версия данных для ключей кэша и ETag. Хранится в базе,
+    чтобы изменения из всех процессов (воркеров, команд управления)
+    были видны каждому процессу.
+    '''
+    name = models.CharField('Название', max_length=100, primary_key=True)
+    value = models.BigIntegerField('Значение')
+
+    objects = DataVersionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name} {self.value}'
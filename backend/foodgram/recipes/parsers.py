@@ -0,0 +1,133 @@
+import json
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import \
+    MultiPartParser as DjangoMultiPartParser
+from django.http.multipartparser import MultiPartParserError
+from django.utils.datastructures import MultiValueDict
+from PIL import Image
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+ERROR_MESSAGE_IMAGE_SIZE = 'Размер изображения превышает {} МБ'
+ERROR_MESSAGE_IMAGE_DIMENSION = ('Ширина и высота изображения '
+                                 'не должны превышать {} пикселей')
+ERROR_MESSAGE_IMAGE_INVALID = 'Загруженный файл не является изображением'
+ERROR_MESSAGE_INVALID_JSON = 'Поле {} должно содержать JSON'
+IMAGE_HEADER_LIMIT = 256 * 1024
+FORM_OVERHEAD = 1024 * 1024
+IMAGE_FIELD = 'image'
+JSON_FIELDS = ('ingredients', 'tags')
+LIST_FIELDS = ('tags',)
+
+
+def check_image_size(size):
+    max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+    if size > max_size:
+        raise ValidationError(
+            ERROR_MESSAGE_IMAGE_SIZE.format(max_size // (1024 * 1024))
+        )
+
+
+def check_image_header(header):
+    '''
+    Проверка габаритов изображения по началу файла. Возвращает False,
+    если для чтения заголовка получено недостаточно данных.
+    '''
+    max_dimension = settings.IMAGE_UPLOAD_MAX_DIMENSION
+    try:
+        with Image.open(BytesIO(header)) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        width = height = max_dimension + 1
+    except OSError:
+        if len(header) < IMAGE_HEADER_LIMIT:
+            return False
+        raise ValidationError(ERROR_MESSAGE_IMAGE_INVALID)
+    if max(width, height) > max_dimension:
+        raise ValidationError(
+            ERROR_MESSAGE_IMAGE_DIMENSION.format(max_dimension)
+        )
+    return True
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    '''
+    Потоковая запись загружаемого файла во временный файл. Размер
+    и габариты изображения проверяются до окончания загрузки.
+    '''
+
+    def handle_raw_input(self, input_data, meta, content_length, boundary,
+                         encoding=None):
+        if content_length:
+            try:
+                check_image_size(content_length - FORM_OVERHEAD)
+            except ValidationError as error:
+                raise ValidationError({IMAGE_FIELD: error.detail})
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.header = b''
+        self.header_checked = False
+
+    def abort(self, error):
+        self.file.close()
+        raise ValidationError({self.field_name: error.detail})
+
+    def receive_data_chunk(self, raw_data, start):
+        try:
+            check_image_size(start + len(raw_data))
+            if not self.header_checked:
+                self.header += raw_data
+                self.header_checked = check_image_header(self.header)
+        except ValidationError as error:
+            self.abort(error)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if not self.header_checked:
+            self.abort(ValidationError(ERROR_MESSAGE_IMAGE_INVALID))
+        return super().file_complete(file_size)
+
+
+class RecipeMultiPartParser(MultiPartParser):
+    '''
+    Приём рецепта в multipart/form-data: изображение передаётся файлом,
+    ингредиенты и тэги — строками JSON (тэги можно и повтором поля).
+    '''
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        upload_handlers = [ImageUploadHandler(request._request)]
+        try:
+            data, files = DjangoMultiPartParser(
+                meta, stream, upload_handlers, encoding
+            ).parse()
+        except MultiPartParserError as exc:
+            raise ParseError(f'Multipart form parse error - {exc}')
+        # Файлы добавляются в обычный словарь данных: при объединении
+        # DRF словарь с MultiValueDict подставил бы списки значений.
+        return DataAndFiles(self.decode_fields(data, files), MultiValueDict())
+
+    def decode_fields(self, data, files):
+        result = files.dict()
+        for key, values in data.lists():
+            if key not in JSON_FIELDS:
+                result[key] = values[-1]
+            elif key in LIST_FIELDS and len(values) > 1:
+                result[key] = values
+            else:
+                try:
+                    value = json.loads(values[-1])
+                except ValueError:
+                    raise ParseError(ERROR_MESSAGE_INVALID_JSON.format(key))
+                if key in LIST_FIELDS and not isinstance(value, list):
+                    value = [value]
+                result[key] = value
+        return result
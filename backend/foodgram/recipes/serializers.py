@@ -1,13 +1,15 @@
-from drf_extra_fields.fields import Base64ImageField
-from rest_framework.serializers import (IntegerField, ModelSerializer,
-                                        PrimaryKeyRelatedField, ReadOnlyField,
-                                        SerializerMethodField)
+from django.db import transaction
+from rest_framework.serializers import (BooleanField, IntegerField, ListField,
+                                        ModelSerializer, ReadOnlyField,
+                                        Serializer, SerializerMethodField)
 from rest_framework.validators import ValidationError
 from users.serializers import CustomUserSerializer
 
-from .addserializers import BaseRecipeDataSerializer
+from . import cache, signals
+from .addserializers import BaseRecipeDataSerializer, get_variant_urls
+from .fields import RecipeImageField
 from .models import (Favourites, Ingredient, IngredientRecipe, Recipe,
-                     ShoppingList, Tag)
+                     ShoppingList, ShoppingListTotal, Tag, TagRecipe)
 
 ERROR_MESSAGE_FOR_ADD_INGREDIENT = ('Нельзя повторно добавлять '
                                     'ранее добавленный ингредиент')
@@ -17,9 +19,27 @@ ERROR_MESSAGE_NO_TAG = 'Необходимо указать хотя бы оди
 ERROR_MESSAGE_FOR_ADD_TAG = ('Нельзя повторно добавлять '
                              'ранее добавленный тэг')
 ERROR_MESSAGE_MIN_TIME = ('Время приготовления должно быть строго больше нуля')
+ERROR_MESSAGE_NO_INGREDIENTS = 'Не найдены ингредиенты с id: {}'
+ERROR_MESSAGE_NO_TAGS = 'Не найдены тэги с id: {}'
+ERROR_MESSAGE_RECIPES_OR_ALL = ('Укажите список рецептов recipes '
+                                'или all для удаления всех')
 MIN_VALUE = 0
 
 
+def get_objects(model, ids, message):
+    '''
+    Получение объектов по списку id одним запросом.
+    Все отсутствующие id перечисляются в одной ошибке.
+    '''
+    objects = model.objects.in_bulk(ids)
+    missing = [pk for pk in ids if pk not in objects]
+    if missing:
+        raise ValidationError(message.format(
+            ', '.join(map(str, missing))
+        ))
+    return [objects[pk] for pk in ids]
+
+
 class TagSerializer(ModelSerializer):
     class Meta:
         model = Tag
@@ -40,14 +60,6 @@ class FavouritesSerializer(ModelSerializer):
         model = Favourites
         fields = ('recipe', 'user')
 
-    def validate(self, data):
-        user = self.context.get('request').user
-        recipe = data.get('recipe')
-        favour = Favourites.objects.filter(user=user, recipe=recipe).exists()
-        if favour:
-            raise ValidationError('Этот рецепт уже добавлен в избранное')
-        return data
-
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
@@ -66,12 +78,25 @@ class IngredientRecipeSerializer(ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class ShoppingListTotalSerializer(ModelSerializer):
+    id = ReadOnlyField(source='ingredient.id')
+    name = ReadOnlyField(source='ingredient.name')
+    measurement_unit = ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = ShoppingListTotal
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
 class RecipeListSerializer(ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = SerializerMethodField(read_only=True)
     is_favorited = SerializerMethodField(read_only=True)
     is_in_shopping_cart = SerializerMethodField(read_only=True)
+    image_variants = SerializerMethodField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -83,22 +108,29 @@ class RecipeListSerializer(ModelSerializer):
             'is_favorited',
             'is_in_shopping_cart',
             'image',
+            'image_variants',
             'name',
             'text',
             'cooking_time'
         )
 
     def get_ingredients(self, obj):
-        ingredients = IngredientRecipe.objects.filter(recipe=obj)
-        return IngredientRecipeSerializer(ingredients, many=True).data
+        return IngredientRecipeSerializer(obj.amount.all(), many=True).data
+
+    def get_image_variants(self, obj):
+        return get_variant_urls(obj, self.context.get('request'))
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
         return Favourites.objects.filter(user=user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -106,7 +138,7 @@ class RecipeListSerializer(ModelSerializer):
 
 
 class AddInRecipeIngredientSerializer(ModelSerializer):
-    id = PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = IntegerField()
     amount = IntegerField()
 
     class Meta:
@@ -116,9 +148,9 @@ class AddInRecipeIngredientSerializer(ModelSerializer):
 
 class RecipeSerializer(ModelSerializer):
 
-    tags = PrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
+    tags = ListField(child=IntegerField())
     ingredients = AddInRecipeIngredientSerializer(many=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
     cooking_time = IntegerField()
 
     class Meta:
@@ -134,62 +166,126 @@ class RecipeSerializer(ModelSerializer):
         )
 
     def validate_ingredients(self, value):
-        uniq_ingredients = []
+        ids = [ingredient['id'] for ingredient in value]
+        if len(set(ids)) != len(ids):
+            raise ValidationError(ERROR_MESSAGE_FOR_ADD_INGREDIENT)
         for ingredient in value:
-            id_ingredient = ingredient.get('id')
-            if id_ingredient in uniq_ingredients:
-                raise ValidationError(ERROR_MESSAGE_FOR_ADD_INGREDIENT)
-            uniq_ingredients.append(id_ingredient)
-            if ingredient.get('amount') <= MIN_VALUE:
+            if ingredient['amount'] <= MIN_VALUE:
                 raise ValidationError(ERROR_MESSAGE_MIN_VALUE_AMOUNT)
+        objects = get_objects(Ingredient, ids, ERROR_MESSAGE_NO_INGREDIENTS)
+        for ingredient, obj in zip(value, objects):
+            ingredient['id'] = obj
         return value
 
     def validate_tags(self, value):
-        uniq_tags = []
         if not value:
             raise ValidationError(ERROR_MESSAGE_NO_TAG)
-        for tag in value:
-            if tag in uniq_tags:
-                raise ValidationError(ERROR_MESSAGE_FOR_ADD_TAG)
-            uniq_tags.append(tag)
-        return value
+        if len(set(value)) != len(value):
+            raise ValidationError(ERROR_MESSAGE_FOR_ADD_TAG)
+        return get_objects(Tag, value, ERROR_MESSAGE_NO_TAGS)
 
     def validate_cooking_time(self, value):
         if value <= MIN_VALUE:
             raise ValidationError(ERROR_MESSAGE_MIN_TIME)
         return value
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(author=author, **validated_data)
-        for tag in tags:
-            recipe.tags.add(tag)
-        for ingredient in ingredients:
-            IngredientRecipe.objects.create(
+        TagRecipe.objects.bulk_create(
+            TagRecipe(recipe=recipe, tag=tag) for tag in tags
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
                 recipe=recipe, ingredient=ingredient['id'],
                 amount=ingredient['amount']
-            )
+            ) for ingredient in ingredients
+        )
+        cache.invalidate_recipes()
         return recipe
 
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        instance = Recipe.objects.with_related().with_user_flags(
+            request.user
+        ).get(pk=instance.pk)
         return RecipeListSerializer(instance, context=context).data
 
+    @staticmethod
+    def update_tags(recipe, tags):
+        old_ids = set(TagRecipe.objects.filter(
+            recipe=recipe
+        ).values_list('tag_id', flat=True))
+        new_ids = {tag.id for tag in tags}
+        if old_ids - new_ids:
+            TagRecipe.objects.filter(
+                recipe=recipe, tag_id__in=old_ids - new_ids
+            ).delete()
+        if new_ids - old_ids:
+            TagRecipe.objects.bulk_create(
+                TagRecipe(recipe=recipe, tag_id=tag_id)
+                for tag_id in new_ids - old_ids
+            )
+
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        '''
+        Приведение ингредиентов рецепта к новому списку: удаляются,
+        добавляются и обновляются только изменившиеся строки.
+        Возвращает изменения количества по ингредиентам.
+        '''
+        old = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        new = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        deltas = {}
+        created = []
+        updated = []
+        for ingredient_id, amount in new.items():
+            row = old.get(ingredient_id)
+            if row is None:
+                created.append(IngredientRecipe(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount
+                ))
+                deltas[ingredient_id] = amount
+            elif row.amount != amount:
+                deltas[ingredient_id] = amount - row.amount
+                row.amount = amount
+                updated.append(row)
+        deleted = old.keys() - new.keys()
+        for ingredient_id in deleted:
+            deltas[ingredient_id] = -old[ingredient_id].amount
+        if deleted:
+            with signals.bulk_change():
+                IngredientRecipe.objects.filter(
+                    recipe=recipe, ingredient_id__in=deleted
+                ).delete()
+        if created:
+            IngredientRecipe.objects.bulk_create(created)
+        if updated:
+            IngredientRecipe.objects.bulk_update(updated, ['amount'])
+        return deltas
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.tags.clear()
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-        for tag in tags:
-            instance.tags.add(tag)
-        for ingredient in ingredients:
-            IngredientRecipe.objects.create(
-                recipe=instance, ingredient=ingredient['id'],
-                amount=ingredient['amount']
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            self.update_tags(instance, tags)
+        if ingredients is not None:
+            deltas = self.update_ingredients(instance, ingredients)
+            ShoppingListTotal.objects.apply_recipe_change(
+                instance.id, deltas
             )
+        cache.invalidate_recipes()
         return super().update(instance, validated_data)
 
 
@@ -203,3 +299,22 @@ class ShoppingListSerializer(ModelSerializer):
         request = self.context.get('request')
         context = {'request': request}
         return BaseRecipeDataSerializer(instance.recipe, context=context).data
+
+
+class RecipeIdsSerializer(Serializer):
+    recipes = ListField(child=IntegerField(), allow_empty=False)
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
+class RecipeIdsOrAllSerializer(RecipeIdsSerializer):
+    recipes = ListField(
+        child=IntegerField(), allow_empty=False, required=False
+    )
+    all = BooleanField(default=False)
+
+    def validate(self, data):
+        if data['all'] == ('recipes' in data):
+            raise ValidationError(ERROR_MESSAGE_RECIPES_OR_ALL)
+        return data
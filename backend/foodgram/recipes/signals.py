@@ -0,0 +1,205 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from users.models import CustomUser, SubscribeModel
+
+from . import cache, counters, feed, tasks
+from .models import (Favourites, Ingredient, IngredientRecipe, Recipe,
+                     ShoppingList, ShoppingListTotal, Tag, TagRecipe)
+
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+bulk_changing = ContextVar('bulk_changing', default=False)
+
+
+@contextmanager
+def bulk_change():
+    '''
+    Массовое изменение избранного, списков покупок и ингредиентов
+    рецептов: обработчики отдельных записей пропускаются, счётчики,
+    итоги и кэш обновляет вызывающий код.
+    '''
+    token = bulk_changing.set(True)
+    try:
+        yield
+    finally:
+        bulk_changing.reset(token)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=TagRecipe)
+@receiver(post_delete, sender=TagRecipe)
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipes_changed(**kwargs):
+    cache.invalidate_recipes()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(**kwargs):
+    cache.bump_on_commit(cache.TAGS_VERSION)
+    cache.invalidate_recipes()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(**kwargs):
+    cache.bump_on_commit(cache.INGREDIENTS_VERSION)
+    cache.invalidate_recipes()
+
+
+@receiver(post_save, sender=CustomUser)
+def author_changed(update_fields=None, **kwargs):
+    if update_fields is None or AUTHOR_FIELDS & set(update_fields):
+        cache.invalidate_recipes()
+
+
+@receiver(post_delete, sender=CustomUser)
+def author_deleted(**kwargs):
+    cache.invalidate_recipes()
+
+
+@receiver(post_save, sender=Favourites)
+@receiver(post_delete, sender=Favourites)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_delete, sender=ShoppingList)
+def user_recipes_changed(instance, **kwargs):
+    if bulk_changing.get():
+        return
+    cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=SubscribeModel)
+@receiver(post_delete, sender=SubscribeModel)
+def subscriptions_changed(instance, **kwargs):
+    cache.invalidate_user(instance.follower_id)
+
+
+@receiver(post_save, sender=Favourites)
+def favourite_created(instance, created, **kwargs):
+    if created:
+        counters.increment(Recipe, instance.recipe_id, 'favourites_count')
+        cache.invalidate_counters()
+
+
+@receiver(post_delete, sender=Favourites)
+def favourite_deleted(instance, **kwargs):
+    if bulk_changing.get():
+        return
+    counters.decrement(Recipe, instance.recipe_id, 'favourites_count')
+    cache.invalidate_counters()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        counters.increment(CustomUser, instance.author_id, 'recipes_count')
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    counters.decrement(CustomUser, instance.author_id, 'recipes_count')
+
+
+@receiver(post_save, sender=ShoppingList)
+def shopping_list_created(instance, created, **kwargs):
+    if created:
+        ShoppingListTotal.objects.add_recipes(
+            instance.user_id, [instance.recipe_id]
+        )
+
+
+# Итог — сумма произведений строк списков покупок на строки ингредиентов.
+# Удаление строки любой из таблиц вычитает её пары с оставшимися строками
+# другой, поэтому при удалении рецепта каждая пара вычитается один раз
+# независимо от порядка каскадного удаления.
+@receiver(post_delete, sender=ShoppingList)
+def shopping_list_deleted(instance, **kwargs):
+    if bulk_changing.get():
+        return
+    ShoppingListTotal.objects.remove_recipes(
+        instance.user_id, [instance.recipe_id]
+    )
+
+
+@receiver(pre_save, sender=IngredientRecipe)
+def ingredient_amount_changing(instance, **kwargs):
+    instance.saved_amount = None
+    if instance.pk and not bulk_changing.get():
+        instance.saved_amount = IngredientRecipe.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', 'ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientRecipe)
+def ingredient_amount_saved(instance, **kwargs):
+    if bulk_changing.get():
+        return
+    changes = defaultdict(lambda: defaultdict(int))
+    if instance.saved_amount:
+        recipe_id, ingredient_id, amount = instance.saved_amount
+        changes[recipe_id][ingredient_id] -= amount
+    changes[instance.recipe_id][instance.ingredient_id] += instance.amount
+    for recipe_id, deltas in changes.items():
+        ShoppingListTotal.objects.apply_recipe_change(recipe_id, deltas)
+
+
+@receiver(post_delete, sender=IngredientRecipe)
+def ingredient_amount_deleted(instance, **kwargs):
+    if bulk_changing.get():
+        return
+    ShoppingListTotal.objects.apply_recipe_change(
+        instance.recipe_id, {instance.ingredient_id: -instance.amount}
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(instance, **kwargs):
+    loaded_image = getattr(instance, 'loaded_image', None)
+    if loaded_image and loaded_image != instance.image.name:
+        transaction.on_commit(lambda: tasks.release_image(loaded_image))
+    instance.loaded_image = instance.image.name
+    if not settings.IMAGE_VARIANTS or not instance.image:
+        return
+    if not instance.variants and not tasks.share_variants(instance):
+        tasks.schedule_variants(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_image_deleted(instance, **kwargs):
+    image_name = instance.image.name
+    transaction.on_commit(lambda: tasks.release_image(image_name))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(instance, created, **kwargs):
+    if created:
+        tasks.schedule(feed.fan_out, instance.id)
+
+
+@receiver(post_save, sender=SubscribeModel)
+def feed_subscribed(instance, created, **kwargs):
+    if created:
+        tasks.schedule(
+            feed.backfill, instance.author_id, [instance.follower_id]
+        )
+
+
+@receiver(post_delete, sender=SubscribeModel)
+def feed_unsubscribed(instance, **kwargs):
+    feed.remove(instance.follower_id, instance.author_id)
+    if CustomUser.objects.filter(
+        id=instance.author_id,
+        followers_count=settings.FEED_FANOUT_LIMIT - 1
+    ).exists():
+        tasks.schedule(feed.backfill, instance.author_id)
@@ -0,0 +1,51 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.utils.deconstruct import deconstructible
+
+
+def lock_name(name):
+    '''
+    Блокировка имени файла до конца транзакции (advisory lock PostgreSQL).
+    Сохранение рецепта с существующим изображением и удаление файла без
+    ссылок выполняются по очереди: удаление видит новый рецепт или
+    сохранение записывает файл заново. На других СУБД не выполняется,
+    и гарантия действует только на PostgreSQL.
+    '''
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [name])
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    '''
+    Хранилище, в котором имя файла определяется хэшем содержимого:
+    одинаковые изображения хранятся в одном экземпляре, повторная
+    запись существующего файла не выполняется.
+    '''
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            directory, hexdigest[:2], hexdigest[2:4], hexdigest + extension
+        )
+
+    def _save(self, name, content):
+        name = self.get_content_name(name, content)
+        lock_name(name)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+recipe_image_storage = ContentAddressedStorage()
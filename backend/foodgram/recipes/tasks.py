@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from . import cache
+from .models import Recipe
+from .storage import lock_name, recipe_image_storage
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'TASK_WORKERS', 2),
+    thread_name_prefix='recipes-tasks'
+)
+
+
+def get_variant_name(image_name, variant):
+    base, _ = os.path.splitext(image_name)
+    return f'{base}_{variant}.webp'
+
+
+def render_variants(image_name):
+    '''
+    Создание уменьшенных копий изображения в формате WebP рядом
+    с оригиналом. Возвращает {название варианта: путь в хранилище}.
+    '''
+    variants = {}
+    with recipe_image_storage.open(image_name) as file, \
+            Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        for variant, size in settings.IMAGE_VARIANTS.items():
+            thumbnail = image.copy()
+            thumbnail.thumbnail(size, Image.LANCZOS)
+            buffer = BytesIO()
+            thumbnail.save(
+                buffer, 'WEBP', quality=settings.IMAGE_VARIANTS_QUALITY
+            )
+            name = get_variant_name(image_name, variant)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            variants[variant] = default_storage.save(
+                name, ContentFile(buffer.getvalue())
+            )
+    return variants
+
+
+def make_variants(recipe_id, image_name):
+    '''
+    Обработка изображения рецепта. Результат сохраняется, только если
+    изображение рецепта не сменилось за время обработки.
+    '''
+    variants = render_variants(image_name)
+    updated = Recipe.objects.filter(id=recipe_id, image=image_name).update(
+        image_variants=json.dumps({'source': image_name, **variants})
+    )
+    if updated:
+        cache.invalidate_recipes()
+    return variants
+
+
+def run_task(function, *args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Ошибка фоновой задачи %s', function.__name__)
+    finally:
+        connections.close_all()
+
+
+def schedule(function, *args):
+    '''
+    Запуск функции в фоновом потоке после фиксации транзакции.
+    При TASKS_EAGER функция выполняется в текущем потоке.
+    '''
+    if settings.TASKS_EAGER:
+        transaction.on_commit(lambda: function(*args))
+        return
+    transaction.on_commit(
+        lambda: executor.submit(run_task, function, *args)
+    )
+
+
+def schedule_variants(recipe):
+    schedule(make_variants, recipe.id, recipe.image.name)
+
+
+def release_image(image_name):
+    '''
+    Удаление изображения и его уменьшенных копий, если на изображение
+    больше не ссылается ни один рецепт.
+    '''
+    if not image_name:
+        return
+    with transaction.atomic():
+        lock_name(image_name)
+        if Recipe.objects.filter(image=image_name).exists():
+            return
+        recipe_image_storage.delete(image_name)
+        for variant in settings.IMAGE_VARIANTS:
+            default_storage.delete(get_variant_name(image_name, variant))
+
+
+def share_variants(recipe):
+    '''
+    Копирование готовых уменьшенных копий от другого рецепта
+    с тем же изображением. Возвращает False, если таких копий нет.
+    '''
+    source = Recipe.objects.filter(image=recipe.image.name).exclude(
+        id=recipe.id
+    ).exclude(image_variants='').only('image', 'image_variants').first()
+    if source is None or not source.variants:
+        return False
+    Recipe.objects.filter(id=recipe.id).update(
+        image_variants=source.image_variants
+    )
+    recipe.image_variants = source.image_variants
+    return True
@@ -0,0 +1,294 @@
+import json
+import os
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import LiveServerTestCase, TestCase, override_settings
+from recipes.counters import recount
+from recipes.management.commands._dataset import encode_copy_value, insert_rows
+from recipes.management.commands.generate_data import DEFAULT_PASSWORD
+from recipes.models import (Favourites, FeedEntry, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingList,
+                            ShoppingListTotal, Tag, TagRecipe)
+from users.models import CustomUser, SubscribeModel
+
+TEMP_MEDIA_ROOT = os.path.join(
+    tempfile.gettempdir(), f'foodgram-test-media-commands-{os.getpid()}'
+)
+CSV_DATA = (
+    'абрикосовое варенье,г\n'
+    'абрикосовое пюре,г\n'
+    'абрикосовое пюре,г\n'
+    'без единицы измерения\n'
+    'соль,по вкусу\n'
+)
+JSON_DATA = [
+    {'name': 'соль', 'measurement_unit': 'по вкусу'},
+    {'name': 'сахар', 'measurement_unit': 'г'},
+    {'name': '', 'measurement_unit': 'г'},
+]
+
+
+class TestLoadIngredients(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='UTF-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, *args):
+        stderr = StringIO()
+        result = call_command(
+            'load_csv_ingredients', *args, '--batch-size', '2',
+            stdout=StringIO(), stderr=stderr
+        )
+        return result, stderr.getvalue()
+
+    def test_load_ingredients_csv(self):
+        '''
+        Тест загрузки ингредиентов из CSV: повторы пропускаются,
+        некорректные строки отклоняются, проверка не пишет в базу.
+        '''
+        path = self.write_file('ingredients.csv', CSV_DATA)
+        result, errors = self.load(path, '--dry-run')
+        self.assertIn('Добавлено: 3, пропущено: 1, отклонено: 1', result)
+        self.assertIn('строка №4', errors)
+        self.assertFalse(Ingredient.objects.exists())
+        result, _ = self.load(path)
+        self.assertEqual(result, 'Добавлено: 3, пропущено: 1, отклонено: 1')
+        self.assertEqual(Ingredient.objects.count(), 3)
+        result, _ = self.load(path)
+        self.assertEqual(result, 'Добавлено: 0, пропущено: 4, отклонено: 1')
+
+    def test_load_ingredients_json(self):
+        '''Тест загрузки ингредиентов из JSON.'''
+        Ingredient.objects.create(name='соль', measurement_unit='по вкусу')
+        path = self.write_file('data.txt', json.dumps(JSON_DATA))
+        result, _ = self.load(path, '--format', 'json')
+        self.assertEqual(result, 'Добавлено: 1, пропущено: 1, отклонено: 1')
+        self.assertTrue(
+            Ingredient.objects.filter(name='сахар', measurement_unit='г')
+        )
+
+
+class TestRecipesDataset(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = (
+            CustomUser.objects.create_user(
+                email=f'{name}@foodgram.ru',
+                username=name,
+                first_name=name,
+                last_name=name,
+                password=name
+            ) for name in ('author', 'reader')
+        )
+        tag = Tag.objects.create(name='Завтрак', color='#FFFFFF', slug='b')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author,
+            name='Рецепт',
+            image='recipes/test.png',
+            text='Описание, "с кавычками"\nи переносом',
+            cooking_time=5
+        )
+        cls.pub_date = Recipe.objects.get().pub_date - timedelta(days=3)
+        Recipe.objects.update(pub_date=cls.pub_date)
+        TagRecipe.objects.create(tag=tag, recipe=cls.recipe)
+        IngredientRecipe.objects.create(
+            ingredient=ingredient, recipe=cls.recipe, amount=3
+        )
+        Favourites.objects.create(user=cls.reader, recipe=cls.recipe)
+        ShoppingList.objects.create(user=cls.reader, recipe=cls.recipe)
+        SubscribeModel.objects.create(author=cls.author, follower=cls.reader)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def run_command(self, name, *args):
+        call_command(name, *args, stdout=StringIO(), stderr=StringIO())
+
+    def check_copy(self, recipe):
+        self.assertEqual(recipe.author, self.author)
+        self.assertEqual(recipe.text, self.recipe.text)
+        self.assertEqual(recipe.pub_date, self.pub_date)
+        self.assertEqual(list(recipe.tags.values_list('slug', flat=True)),
+                         ['b'])
+        self.assertEqual(
+            list(recipe.amount.values_list('ingredient__name', 'amount')),
+            [('соль', 3)]
+        )
+        self.assertEqual(recipe.favourites_count, 1)
+        self.assertTrue(
+            ShoppingList.objects.filter(user=self.reader, recipe=recipe)
+        )
+        self.assertEqual(
+            ShoppingListTotal.objects.get(user=self.reader).amount,
+            IngredientRecipe.objects.filter(
+                recipe__shoppinglist__user=self.reader
+            ).count() * 3
+        )
+
+    def test_export_import_ndjson(self):
+        '''
+        Тест выгрузки и загрузки NDJSON: пользователи, тэги
+        и ингредиенты сопоставляются с существующими, рецепт
+        добавляется копией со всеми связями.
+        '''
+        path = os.path.join(self.directory.name, 'recipes.ndjson')
+        self.run_command('export_recipes', path)
+        self.run_command('import_recipes', path, '--batch-size', '1')
+        self.assertEqual(CustomUser.objects.count(), 2)
+        self.assertEqual(Tag.objects.count(), 1)
+        self.assertEqual(Ingredient.objects.count(), 1)
+        self.assertEqual(SubscribeModel.objects.count(), 1)
+        copy = Recipe.objects.exclude(id=self.recipe.id).get()
+        self.check_copy(copy)
+        self.assertEqual(
+            CustomUser.objects.get(id=self.author.id).recipes_count, 2
+        )
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.reader).count(), 2
+        )
+
+    def test_export_import_csv(self):
+        '''Тест переноса данных в пустую базу через файлы CSV.'''
+        self.run_command(
+            'export_recipes', self.directory.name, '--with-passwords'
+        )
+        CustomUser.objects.all().delete()
+        Tag.objects.all().delete()
+        self.run_command('import_recipes', self.directory.name)
+        self.author = CustomUser.objects.get(email='author@foodgram.ru')
+        self.reader = CustomUser.objects.get(email='reader@foodgram.ru')
+        self.assertTrue(self.author.check_password('author'))
+        self.check_copy(Recipe.objects.get())
+        self.assertEqual(self.author.followers_count, 1)
+
+    def test_export_import_stream(self):
+        '''
+        Тест выгрузки в stdout и загрузки из stdin: поток всегда
+        в формате NDJSON, CSV для потока не поддерживается.
+        '''
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory.name)
+        output = StringIO()
+        with redirect_stdout(output):
+            self.run_command('export_recipes', '-')
+        self.assertFalse(os.path.exists('-'))
+        with mock.patch('sys.stdin', StringIO(output.getvalue())):
+            self.run_command('import_recipes', '-')
+        self.check_copy(Recipe.objects.exclude(id=self.recipe.id).get())
+        for name in ('export_recipes', 'import_recipes'):
+            with self.subTest(command=name):
+                with self.assertRaises(CommandError):
+                    self.run_command(name, '-', '--format', 'csv')
+
+    def test_encode_copy_value(self):
+        '''
+        Тест записи полей для COPY: NULL — пустое поле без кавычек,
+        пустая строка и кавычки — в кавычках.
+        '''
+        self.assertEqual(encode_copy_value(None), '')
+        self.assertEqual(encode_copy_value(''), '""')
+        self.assertEqual(encode_copy_value('a "b"'), '"a ""b"""')
+        self.assertEqual(encode_copy_value(5), '"5"')
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY есть в PostgreSQL')
+    def test_copy_rows_nulls(self):
+        '''
+        Тест записи командой COPY строк с пустыми значениями
+        в полях, допускающих NULL, и с пустыми строками.
+        '''
+        insert_rows(CustomUser, [{
+            'id': CustomUser.objects.order_by('-id').first().id + 1,
+            'email': 'copy@foodgram.ru',
+            'username': 'copy',
+            'first_name': '',
+            'last_name': 'copy',
+            'password': '!',
+            'last_login': None,
+        }])
+        user = CustomUser.objects.get(username='copy')
+        self.assertIsNone(user.last_login)
+        self.assertEqual(user.first_name, '')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class TestGenerateData(LiveServerTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(20)
+        )
+        self.output = self.run_command(
+            'generate_data', '--users', '5', '--recipes', '30',
+            '--favourites', '3', '--cart', '2', '--subscriptions', '2',
+            '--seed', '1'
+        )
+
+    def run_command(self, name, *args):
+        stdout = StringIO()
+        call_command(name, *args, stdout=stdout, stderr=StringIO())
+        return stdout.getvalue()
+
+    def test_generate_data(self):
+        '''
+        Тест создания синтетических данных: связи рецептов созданы,
+        счётчики согласованы с данными, в отчёте — число добавленных строк.
+        '''
+        self.assertEqual(
+            set(self.output.splitlines()),
+            {f'{model.__name__}: {model.objects.count()}' for model in (
+                CustomUser, Recipe, TagRecipe, IngredientRecipe, Favourites,
+                ShoppingList, SubscribeModel
+            )}
+        )
+        self.assertEqual(CustomUser.objects.count(), 5)
+        self.assertEqual(Recipe.objects.count(), 30)
+        self.assertEqual(Tag.objects.count(), 3)
+        for recipe in Recipe.objects.all():
+            self.assertTrue(1 <= recipe.tags.count() <= 3)
+            self.assertTrue(3 <= recipe.amount.count() <= 12)
+        self.assertEqual(set(recount(fix=False).values()), {0})
+        self.assertEqual(
+            ShoppingListTotal.objects.count(),
+            IngredientRecipe.objects.filter(
+                recipe__shoppinglist__isnull=False
+            ).values('recipe__shoppinglist__user', 'ingredient').distinct()
+            .count()
+        )
+        self.assertTrue(
+            CustomUser.objects.get(username='user1').check_password(
+                DEFAULT_PASSWORD
+            )
+        )
+
+    def test_load_test(self):
+        '''Тест нагрузочного теста: отчёт по эндпоинтам без ошибок.'''
+        output = self.run_command(
+            'load_test', '--url', self.live_server_url,
+            '--duration', '1', '--concurrency', '1', '--seed', '1'
+        )
+        lines = {line.split()[0]: line.split() for line in
+                 output.splitlines()[2:]}
+        self.assertGreater(int(lines['total'][1]), 0)
+        self.assertEqual(lines['total'][2], '0')
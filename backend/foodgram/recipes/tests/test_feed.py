@@ -0,0 +1,88 @@
+from django.urls import reverse
+from recipes.models import FeedEntry, Recipe
+from rest_framework import status
+from rest_framework.test import (APIClient, APITransactionTestCase,
+                                 override_settings)
+from users.models import CustomUser
+
+FEED_URL = '/api/recipes/feed/'
+
+
+@override_settings(TASKS_EAGER=True, IMAGE_VARIANTS={})
+class TestRecipeFeed(APITransactionTestCase):
+    def setUp(self):
+        self.reader, self.author, self.other = (
+            CustomUser.objects.create_user(
+                email=f'{name}@foodgram.ru',
+                username=name,
+                first_name=name,
+                last_name=name,
+                password=name
+            ) for name in ('reader', 'author', 'other')
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.reader)
+
+    def create_recipe(self, author, name):
+        return Recipe.objects.create(
+            author=author,
+            name=name,
+            image='Test image',
+            text='Test text',
+            cooking_time=1
+        )
+
+    def subscribe(self, author, method='post'):
+        url = reverse('users:subscribe', kwargs={'id': author.id})
+        return getattr(self.client, method)(url)
+
+    def get_feed_names(self, params=None):
+        response = self.client.get(FEED_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_feed_fan_out_and_backfill(self):
+        '''
+        Тест ленты: рецепты автора добавляются при подписке и публикации
+        и удаляются из ленты при отписке.
+        '''
+        self.create_recipe(self.author, 'Old recipe')
+        self.create_recipe(self.other, 'Other recipe')
+        self.subscribe(self.author)
+        self.assertEqual(self.get_feed_names(), ['Old recipe'])
+        self.create_recipe(self.author, 'New recipe')
+        self.assertEqual(
+            sorted(self.get_feed_names()), ['New recipe', 'Old recipe']
+        )
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 2)
+        self.subscribe(self.author, 'delete')
+        self.assertEqual(self.get_feed_names(), [])
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_feed_popular_author_read_fallback(self):
+        '''
+        Тест ленты для автора с большим числом подписчиков: рецепты
+        не рассылаются в ленты, а читаются напрямую.
+        '''
+        with override_settings(FEED_FANOUT_LIMIT=1):
+            self.subscribe(self.author)
+            self.create_recipe(self.author, 'Popular recipe')
+            self.assertFalse(FeedEntry.objects.exists())
+            self.assertEqual(self.get_feed_names(), ['Popular recipe'])
+
+    def test_feed_keyset_pagination(self):
+        '''Тест постраничного вывода ленты по курсору.'''
+        self.subscribe(self.author)
+        for number in range(3):
+            self.create_recipe(self.author, f'Recipe {number}')
+        response = self.client.get(FEED_URL, {'limit': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertNotIn('count', response.data)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+
+    def test_feed_guest_not_access(self):
+        '''Тест недоступности ленты неаутентифицированному пользователю.'''
+        response = APIClient().get(FEED_URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
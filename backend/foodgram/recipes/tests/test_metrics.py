@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.urls import reverse
+from foodgram.metrics import EXITED_FILE, registry
+from rest_framework.test import APIClient, APITestCase, override_settings
+
+METRICS_DIR = os.path.join(
+    tempfile.gettempdir(), f'foodgram-test-metrics-{os.getpid()}'
+)
+
+
+@override_settings(METRICS_DIR=METRICS_DIR, METRICS_FLUSH_INTERVAL=60)
+class TestMetrics(APITestCase):
+    def setUp(self):
+        registry.reset()
+
+    def tearDown(self):
+        shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
+    def get_metrics(self):
+        response = APIClient().get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode().splitlines()
+
+    def test_metrics_requests(self):
+        '''Тест счётчиков запросов, гистограммы и запросов к базе.'''
+        client = APIClient()
+        for _ in range(2):
+            client.get(reverse('recipes:recipe-list'))
+        client.get('/api/unknown/')
+        lines = self.get_metrics()
+        self.assertIn(
+            'foodgram_http_requests_total{view="recipes:recipe-list",'
+            'method="GET",status="200"} 2', lines
+        )
+        self.assertIn(
+            'foodgram_http_requests_total{view="<unmatched>",'
+            'method="GET",status="404"} 1', lines
+        )
+        self.assertIn(
+            'foodgram_http_request_duration_seconds_bucket{'
+            'view="recipes:recipe-list",method="GET",le="+Inf"} 2', lines
+        )
+        self.assertIn(
+            'foodgram_http_request_duration_seconds_count{'
+            'view="recipes:recipe-list",method="GET"} 2', lines
+        )
+        self.assertTrue(any(
+            line.startswith('foodgram_db_queries_total{'
+                            'view="recipes:recipe-list"}')
+            for line in lines
+        ))
+        self.assertTrue(any(
+            line.startswith('foodgram_cache_hit_ratio{cache="recipes"}')
+            for line in lines
+        ))
+        self.assertIn(
+            f'foodgram_worker_info{{pid="{os.getpid()}",'
+            f'ppid="{os.getppid()}"}} 1', lines
+        )
+
+    def test_metrics_aggregate_workers(self):
+        '''
+        Тест суммирования значений процессов: файл завершившегося
+        процесса переносится в общий файл и учитывается в суммах
+        один раз, но не в списке работающих.
+        '''
+        APIClient().get(reverse('recipes:recipe-list'))
+        registry.flush()
+        worker = registry.dump()
+        pid = worker['pid'] + 1
+        while True:
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                break
+            except PermissionError:
+                pass
+            pid += 1
+        worker.update(pid=pid, started=0)
+        worker['caches'] = {'recipes': {'hits': 3, 'misses': 1}}
+        path = os.path.join(METRICS_DIR, f'{pid}-0.json')
+        with open(path, 'w') as file:
+            json.dump(worker, file)
+        for _ in range(2):
+            lines = self.get_metrics()
+            self.assertIn(
+                'foodgram_http_requests_total{view="recipes:recipe-list",'
+                'method="GET",status="200"} 2', lines
+            )
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(
+            sorted(os.listdir(METRICS_DIR)),
+            sorted(['.lock', EXITED_FILE, registry.get_path().name])
+        )
+        self.assertFalse(any(f'pid="{pid}"' in line for line in lines))
+        hits = registry.dump()['caches']['recipes']['hits'] + 3
+        self.assertIn(f'foodgram_cache_hits_total{{cache="recipes"}} {hits}',
+                      lines)
+
+    def test_metrics_disabled(self):
+        '''Тест отключения метрик.'''
+        with self.settings(METRICS_ENABLED=False):
+            response = APIClient().get(reverse('metrics'))
+        self.assertEqual(response.status_code, 404)
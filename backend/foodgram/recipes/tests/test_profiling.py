@@ -0,0 +1,91 @@
+import json
+
+from django.http import JsonResponse
+from django.test import RequestFactory
+from django.urls import reverse
+from foodgram.middleware import ProfilingMiddleware
+from recipes.models import Recipe
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APITestCase, override_settings
+from users.models import CustomUser
+from users.serializers import SubscribeSerializer
+
+MIDDLEWARE = ['foodgram.middleware.ProfilingMiddleware']
+
+
+@override_settings(
+    PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0,
+    PROFILING_DUPLICATE_THRESHOLD=3, RECIPES_CACHE_ENABLED=False
+)
+class TestProfilingMiddleware(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.authors = [
+            CustomUser.objects.create_user(
+                email=f'author{number}@foodgram.ru',
+                username=f'author{number}',
+                first_name='author',
+                last_name='author',
+                password='author'
+            ) for number in range(3)
+        ]
+        for author in cls.authors:
+            Recipe.objects.create(
+                author=author,
+                name='Test name',
+                image='Test image',
+                text='Test text',
+                cooking_time=1
+            )
+
+    def get_record(self, logs):
+        return json.loads(logs.records[-1].getMessage())
+
+    def test_profiling_server_timing(self):
+        '''
+        Тест заголовка Server-Timing и строки журнала
+        для профилируемого запроса.
+        '''
+        client = APIClient()
+        with self.settings(MIDDLEWARE=MIDDLEWARE), \
+                self.assertLogs('foodgram.profiling', 'INFO') as logs:
+            response = client.get(reverse('recipes:recipe-list'))
+        timing = response['Server-Timing']
+        for name in ('db', 'serializer', 'render', 'total'):
+            self.assertIn(f'{name};', timing)
+        record = self.get_record(logs)
+        self.assertEqual(record['view'], 'recipes:recipe-list')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertIn(f'desc="{record["queries"]} queries"', timing)
+        self.assertGreater(record['serializer_ms'], 0)
+        self.assertEqual(record['duplicates'], [])
+
+    def test_profiling_sample_rate(self):
+        '''Тест отключения профилирования нулевой долей запросов.'''
+        client = APIClient()
+        with self.settings(MIDDLEWARE=MIDDLEWARE, PROFILING_SAMPLE_RATE=0):
+            response = client.get(reverse('recipes:recipe-list'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_profiling_duplicates(self):
+        '''
+        Тест обнаружения повторяющихся запросов с указанием метода
+        сериализатора, который их выполнил.
+        '''
+        request = RequestFactory().get('/')
+
+        def view(request):
+            serializer = SubscribeSerializer(
+                self.authors, many=True, context={'request': Request(request)}
+            )
+            return JsonResponse(serializer.data, safe=False)
+
+        with self.assertLogs('foodgram.profiling', 'WARNING') as logs:
+            ProfilingMiddleware(view)(request)
+        duplicate, = self.get_record(logs)['duplicates']
+        self.assertEqual(duplicate['count'], len(self.authors))
+        self.assertEqual(
+            duplicate['source'], 'SubscribeSerializer.get_recipes'
+        )
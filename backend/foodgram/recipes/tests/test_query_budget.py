@@ -0,0 +1,48 @@
+from recipes.benchmark import build_dataset, run_benchmark, run_write_benchmark
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+SMALL_DATASET = 10
+LARGE_DATASET = 100
+
+
+class TestQueryBudget(APITestCase):
+    def check_budget(self, size):
+        '''
+        Проверка соблюдения бюджета запросов к базе
+        для всех эндпоинтов на наборе данных заданного размера.
+        '''
+        for result in run_benchmark(build_dataset(size)):
+            with self.subTest(endpoint=result.endpoint, size=size):
+                self.assertEqual(result.status, status.HTTP_200_OK)
+                self.assertFalse(
+                    result.over_budget,
+                    f'{result.queries} > {result.budget}: {result.duplicates}'
+                )
+
+    def test_small_dataset_within_budget(self):
+        '''Тест бюджета запросов на небольшом наборе данных.'''
+        self.check_budget(SMALL_DATASET)
+
+    def test_large_dataset_within_budget(self):
+        '''
+        Тест независимости количества запросов
+        от размера набора данных.
+        '''
+        self.check_budget(LARGE_DATASET)
+
+    def test_recipe_write_within_budget(self):
+        '''
+        Тест бюджета запросов при создании и обновлении
+        рецепта с большим количеством ингредиентов.
+        '''
+        for result in run_write_benchmark(build_dataset(SMALL_DATASET)):
+            with self.subTest(endpoint=result.endpoint):
+                self.assertIn(
+                    result.status,
+                    (status.HTTP_200_OK, status.HTTP_201_CREATED)
+                )
+                self.assertFalse(
+                    result.over_budget,
+                    f'{result.queries} > {result.budget}'
+                )
@@ -0,0 +1,153 @@
+import base64
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.urls import reverse
+from PIL import Image
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.storage import lock_name
+from rest_framework import status
+from rest_framework.test import (APIClient, APITransactionTestCase,
+                                 override_settings)
+from users.models import CustomUser
+
+TEMP_MEDIA_ROOT = os.path.join(
+    tempfile.gettempdir(), f'foodgram-test-media-{os.getpid()}'
+)
+
+CREATE_USER_DICT = dict(
+    email='TestUser@testuser.ru',
+    username='TestUser',
+    first_name='test',
+    last_name='test',
+    password='testuser'
+)
+
+
+def make_image(color):
+    '''Изображение PNG заданного цвета в виде строки base64.'''
+    buffer = BytesIO()
+    Image.new('RGB', (2, 2), color).save(buffer, 'PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+def count_files(root):
+    return sum(len(files) for _, _, files in os.walk(root))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_VARIANTS={})
+class TestRecipeImageStorage(APITransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        self.user = CustomUser.objects.create_user(**CREATE_USER_DICT)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        tag = Tag.objects.create(name='Test tag', color='#FFFF', slug='test')
+        ingredient = Ingredient.objects.create(
+            name='Test ingredient', measurement_unit='Test unit'
+        )
+        self.recipe_dict = dict(
+            tags=[tag.id],
+            ingredients=[{'id': ingredient.id, 'amount': 1}],
+            name='Test name',
+            image=make_image('red'),
+            text='Test text',
+            cooking_time=1
+        )
+
+    def create_recipe(self):
+        response = self.client.post(
+            reverse('recipes:recipe-list'), data=self.recipe_dict,
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Recipe.objects.get(id=response.data['id'])
+
+    def test_same_image_stored_once(self):
+        '''Тест хранения одинаковых изображений в одном файле.'''
+        first = self.create_recipe()
+        second = self.create_recipe()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(count_files(TEMP_MEDIA_ROOT), 1)
+
+    def test_unreferenced_image_removed(self):
+        '''
+        Тест удаления изображения после замены и удаления рецепта,
+        пока на него не ссылаются другие рецепты.
+        '''
+        first = self.create_recipe()
+        second = self.create_recipe()
+        self.recipe_dict['image'] = make_image('blue')
+        response = self.client.patch(
+            reverse('recipes:recipe-detail', kwargs={'pk': first.id}),
+            data=self.recipe_dict, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(os.path.exists(second.image.path))
+        self.assertEqual(count_files(TEMP_MEDIA_ROOT), 2)
+        second.delete()
+        self.assertFalse(os.path.exists(second.image.path))
+        self.assertEqual(count_files(TEMP_MEDIA_ROOT), 1)
+
+    def test_collect_image_garbage(self):
+        '''Тест удаления командой файлов, на которые нет ссылок.'''
+        recipe = self.create_recipe()
+        orphan = os.path.join(TEMP_MEDIA_ROOT, 'recipes', 'orphan.png')
+        with open(orphan, 'wb') as file:
+            file.write(b'orphan')
+        old = time.time() - 2 * 60 * 60
+        for path in (orphan, recipe.image.path):
+            os.utime(path, (old, old))
+        call_command('collect_image_garbage', '--dry-run', stdout=StringIO())
+        self.assertTrue(os.path.exists(orphan))
+        call_command('collect_image_garbage', stdout=StringIO())
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(recipe.image.path))
+
+    def test_release_and_save_take_image_lock(self):
+        '''
+        Тест блокировки имени файла при сохранении и удалении
+        изображения: сохранение после удаления записывает файл заново.
+        '''
+        with mock.patch('recipes.storage.lock_name') as storage_lock:
+            first = self.create_recipe()
+        storage_lock.assert_called_once_with(first.image.name)
+        with mock.patch('recipes.tasks.lock_name') as release_lock:
+            first.delete()
+        release_lock.assert_called_once_with(first.image.name)
+        self.assertFalse(os.path.exists(first.image.path))
+        second = self.create_recipe()
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertTrue(os.path.exists(second.image.path))
+
+    @skipUnless(connection.vendor == 'postgresql',
+                'Блокировка выполняется только в PostgreSQL')
+    def test_image_lock_postgresql(self):
+        '''
+        Тест блокировки имени файла до конца транзакции: другое
+        соединение не получает блокировку того же имени.
+        '''
+        name = 'recipes/test.png'
+        other = connection.copy()
+        self.addCleanup(other.close)
+        query = 'SELECT pg_try_advisory_xact_lock(hashtext(%s))'
+        with transaction.atomic():
+            lock_name(name)
+            with other.cursor() as cursor:
+                cursor.execute(query, [name])
+                self.assertFalse(cursor.fetchone()[0])
+        with other.cursor() as cursor:
+            cursor.execute(query, [name])
+            self.assertTrue(cursor.fetchone()[0])
@@ -1,10 +1,23 @@
+import base64
+import json
 import shutil
 import tempfile
+from io import BytesIO, StringIO
 
 from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.models.signals import post_save
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from recipes.models import (Favourites, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingList, Tag)
+from PIL import Image
+from recipes.cache import INGREDIENTS_VERSION, TAGS_VERSION
+from recipes.models import (DataVersion, Favourites, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingList,
+                            ShoppingListTotal, Tag)
+from recipes.tasks import make_variants
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase, override_settings
 from users.models import CustomUser
@@ -115,6 +128,9 @@ class TestRecipeURL(APITestCase):
         super().tearDownClass()
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
+    def setUp(self):
+        cache.clear()
+
     def create_obj(self, model, url):
         '''Метод для создания объекта в базе данных.'''
         count = model.objects.count()
@@ -171,6 +187,139 @@ class TestRecipeURL(APITestCase):
         self.assertEqual(Recipe.objects.count(), recipe_count + 1)
         self.assertEqual(Recipe.objects.get(id=2).name, 'Test name3')
 
+    def test_create_recipe_invalid_ids_url(self):
+        '''
+        Тест валидации id тэгов и ингредиентов: все отсутствующие id
+        перечисляются в одной ошибке, повторы отклоняются.
+        '''
+        missing = self.INGREDIENT.id + 100
+        cases = {
+            'ingredients': dict(self.CREATE_RECIPE_DICT, ingredients=[
+                {'id': self.INGREDIENT.id, 'amount': AMOUNT_INGREDIENT},
+                {'id': missing, 'amount': AMOUNT_INGREDIENT},
+                {'id': missing + 1, 'amount': AMOUNT_INGREDIENT},
+            ]),
+            'tags': dict(self.CREATE_RECIPE_DICT, tags=[
+                self.TAG.id, self.TAG.id + 100, self.TAG.id + 101
+            ]),
+        }
+        for field, data in cases.items():
+            with self.subTest(field=field):
+                response = self.auth_client.post(
+                    self.URL_DICT['recipe-list'], data=data, format='json'
+                )
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+                self.assertEqual(len(response.data[field]), 1)
+                self.assertRegex(
+                    response.data[field][0], r'\d+, \d+$'
+                )
+        response = self.auth_client.post(
+            self.URL_DICT['recipe-list'],
+            data=dict(self.CREATE_RECIPE_DICT, tags=[self.TAG.id] * 2),
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_recipe_image_variants_url(self):
+        '''
+        Тест уменьшенных копий изображения: появляются в выдаче после
+        обработки, переиспользуются для того же изображения
+        и скрываются после его смены.
+        '''
+        response = self.auth_client.post(
+            self.URL_DICT['recipe-list'],
+            data=self.CREATE_RECIPE_DICT,
+            format='json'
+        )
+        self.assertEqual(response.data['image_variants'], {})
+        recipe = Recipe.objects.get(id=response.data['id'])
+        variants = make_variants(recipe.id, recipe.image.name)
+        self.assertEqual(set(variants), set(settings.IMAGE_VARIANTS))
+        url = reverse('recipes:recipe-detail', kwargs={'pk': recipe.id})
+        response = self.auth_client.get(url)
+        self.assertEqual(
+            set(response.data['image_variants']),
+            set(settings.IMAGE_VARIANTS)
+        )
+        self.assertTrue(all(
+            link.endswith('.webp')
+            for link in response.data['image_variants'].values()
+        ))
+        response = self.auth_client.post(
+            self.URL_DICT['recipe-list'],
+            data=self.CREATE_RECIPE_DICT,
+            format='json'
+        )
+        self.assertEqual(
+            set(response.data['image_variants']),
+            set(settings.IMAGE_VARIANTS)
+        )
+        buffer = BytesIO()
+        Image.new('RGB', (2, 2), 'red').save(buffer, 'PNG')
+        image = base64.b64encode(buffer.getvalue()).decode()
+        response = self.auth_client.patch(
+            url,
+            data=dict(
+                self.CREATE_RECIPE_DICT,
+                image=f'data:image/png;base64,{image}'
+            ),
+            format='json'
+        )
+        self.assertEqual(response.data['image_variants'], {})
+
+    def test_multipart_create_recipe_url(self):
+        '''
+        Тест создания рецепта с изображением в виде файла multipart
+        и отклонения изображений сверх ограничений размера и габаритов.
+        '''
+        image = base64.b64decode(TEST_IMAGE.split(';base64,')[1])
+        new_tag = Tag.objects.create(
+            name='New tag', color='#000000', slug='new-tag'
+        )
+
+        def post():
+            return self.auth_client.post(
+                self.URL_DICT['recipe-list'],
+                data=dict(
+                    self.CREATE_RECIPE_DICT,
+                    tags=[self.TAG.id, new_tag.id],
+                    ingredients=json.dumps(
+                        self.CREATE_RECIPE_DICT['ingredients']
+                    ),
+                    image=SimpleUploadedFile(
+                        'image.png', image, content_type='image/png'
+                    )
+                ),
+                format='multipart'
+            )
+
+        response = post()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['tags']), 2)
+        self.assertEqual(len(response.data['ingredients']), 1)
+        limits = (
+            {'IMAGE_UPLOAD_MAX_SIZE': len(image) - 1},
+            {'IMAGE_UPLOAD_MAX_DIMENSION': 0},
+        )
+        for limit in limits:
+            with self.subTest(limit=limit), override_settings(**limit):
+                response = post()
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+                self.assertIn('image', response.data)
+                response = self.auth_client.post(
+                    self.URL_DICT['recipe-list'],
+                    data=self.CREATE_RECIPE_DICT,
+                    format='json'
+                )
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+                self.assertIn('image', response.data)
+
     def test_auth_patch_url(self):
         '''Тест обновления рецепта автором.'''
         patch_recipe_dict = self.CREATE_RECIPE_DICT
@@ -188,6 +337,56 @@ class TestRecipeURL(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(Recipe.objects.get(id=pk).name, 'Test name4')
 
+    def test_auth_patch_changes_only_diff_url(self):
+        '''
+        Тест обновления рецепта: неизменённые ингредиенты и тэги
+        сохраняются, изменённые обновляются, лишние удаляются.
+        '''
+        new_tag = Tag.objects.create(
+            name='New tag', color='#000000', slug='new-tag'
+        )
+        new_ingredient = Ingredient.objects.create(
+            name='New ingredient', measurement_unit='Test unit'
+        )
+        kept = IngredientRecipe.objects.get(recipe=self.RECIPE)
+        patch_recipe_dict = dict(
+            self.CREATE_RECIPE_DICT,
+            tags=[new_tag.id],
+            ingredients=[
+                {'id': self.INGREDIENT.id, 'amount': AMOUNT_INGREDIENT + 1},
+                {'id': new_ingredient.id, 'amount': AMOUNT_INGREDIENT},
+            ]
+        )
+        response = self.auth_client.patch(
+            self.URL_DICT['recipe-detail'],
+            data=patch_recipe_dict,
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['id'] for tag in response.data['tags']], [new_tag.id]
+        )
+        self.assertEqual(
+            IngredientRecipe.objects.get(id=kept.id).amount,
+            AMOUNT_INGREDIENT + 1
+        )
+        response = self.auth_client.patch(
+            self.URL_DICT['recipe-detail'],
+            data={'ingredients': [
+                {'id': new_ingredient.id, 'amount': AMOUNT_INGREDIENT}
+            ]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            list(self.RECIPE.ingredients.values_list('id', flat=True)),
+            [new_ingredient.id]
+        )
+        self.assertEqual(
+            list(self.RECIPE.tags.values_list('id', flat=True)),
+            [new_tag.id]
+        )
+
     def test_auth_recipe_delete_url(self):
         '''Тест удаления рецепта автором.'''
         recipe_count = Recipe.objects.count()
@@ -222,6 +421,127 @@ class TestRecipeURL(APITestCase):
         self.create_obj(ShoppingList, url)
         self.delete_obj(ShoppingList, url)
 
+    def test_repeated_toggle_url(self):
+        '''
+        Тест повторного добавления и удаления рецепта в избранном
+        и списке покупок, а также обращения к несуществующему рецепту.
+        '''
+        pk = self.RECIPE.id
+        for url in ('/api/recipes/{}/favorite/',
+                    '/api/recipes/{}/shopping_cart/'):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.auth_client.post(url.format(pk)).status_code,
+                    status.HTTP_201_CREATED
+                )
+                self.assertEqual(
+                    self.auth_client.post(url.format(pk)).status_code,
+                    status.HTTP_400_BAD_REQUEST
+                )
+                self.assertEqual(
+                    self.auth_client.delete(url.format(pk)).status_code,
+                    status.HTTP_204_NO_CONTENT
+                )
+                self.assertEqual(
+                    self.auth_client.delete(url.format(pk)).status_code,
+                    status.HTTP_400_BAD_REQUEST
+                )
+                for method in ('post', 'delete'):
+                    response = getattr(self.auth_client, method)(
+                        url.format(pk + 100)
+                    )
+                    self.assertEqual(
+                        response.status_code, status.HTTP_400_BAD_REQUEST
+                    )
+        self.RECIPE.refresh_from_db()
+        self.assertEqual(self.RECIPE.favourites_count, 0)
+
+    def test_toggle_side_effect_error_url(self):
+        '''
+        Тест ошибки целостности в обработчике сигнала: она не выдаётся
+        за повторное добавление рецепта.
+        '''
+        def fail(**kwargs):
+            raise IntegrityError('side effect')
+
+        pk = Recipe.objects.first().id
+        post_save.connect(fail, sender=Favourites)
+        try:
+            with self.assertRaisesMessage(IntegrityError, 'side effect'):
+                self.auth_client.post(f'/api/recipes/{pk}/favorite/')
+        finally:
+            post_save.disconnect(fail, sender=Favourites)
+        self.assertFalse(Favourites.objects.exists())
+
+    def test_batch_toggle_url(self):
+        '''
+        Тест массового добавления, удаления и очистки избранного
+        и списка покупок с результатом по каждому рецепту.
+        '''
+        recipe = Recipe.objects.create(
+            author=self.USER,
+            name='Second recipe',
+            image='Test image',
+            text='Test text',
+            cooking_time=COOKING_TIME
+        )
+        missing = recipe.id + 100
+        totals_url = '/api/recipes/shopping_cart_totals/'
+        for action, model in (('favorite', Favourites),
+                              ('shopping_cart', ShoppingList)):
+            url = f'/api/recipes/{action}/'
+            with self.subTest(url=url):
+                self.auth_client.post(
+                    f'/api/recipes/{self.RECIPE.id}/{action}/'
+                )
+                response = self.auth_client.post(url, data={
+                    'recipes': [self.RECIPE.id, recipe.id, missing]
+                }, format='json')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(
+                    [item['status'] for item in response.data['results']],
+                    ['exists', 'added', 'not_found']
+                )
+                self.assertEqual(
+                    model.objects.filter(user=self.USER).count(), 2
+                )
+                response = self.auth_client.delete(url, data={
+                    'recipes': [recipe.id, missing]
+                }, format='json')
+                self.assertEqual(
+                    [item['status'] for item in response.data['results']],
+                    ['removed', 'missing']
+                )
+                for data in (None, {'recipe': [recipe.id]},
+                             {'all': True, 'recipes': [recipe.id]}):
+                    response = self.auth_client.delete(
+                        url, data=data, format='json'
+                    )
+                    self.assertEqual(
+                        response.status_code, status.HTTP_400_BAD_REQUEST
+                    )
+                self.assertTrue(model.objects.filter(user=self.USER))
+                response = self.auth_client.delete(
+                    url, data={'all': True}, format='json'
+                )
+                self.assertEqual(
+                    response.data['results'],
+                    [{'id': self.RECIPE.id, 'status': 'removed'}]
+                )
+                self.assertFalse(model.objects.filter(user=self.USER))
+                response = self.auth_client.post(
+                    url, data={'recipes': []}, format='json'
+                )
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+        self.RECIPE.refresh_from_db()
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (self.RECIPE.favourites_count, recipe.favourites_count), (0, 0)
+        )
+        self.assertEqual(self.auth_client.get(totals_url).data, [])
+
     def test_shoppinglist_auth_get_url(self):
         '''Тест скачивания списка покупок в формате CSV.'''
         create_url = '/api/recipes/{}/shopping_cart/'
@@ -229,11 +549,474 @@ class TestRecipeURL(APITestCase):
         get_url = '/api/recipes/download_shopping_cart/'
         response = self.auth_client.get(get_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        data = response.content.decode('utf-8').split(',')
+        data = b''.join(
+            response.streaming_content
+        ).decode('utf-8').split(',')
         self.assertEqual(int(data[6][:1]), AMOUNT_INGREDIENT)
         content_type = response.__dict__['_headers']['content-type'][1]
         self.assertEqual(content_type, CONTENT_TYPE)
 
+    def test_shoppinglist_groups_by_unit_url(self):
+        '''
+        Тест суммирования ингредиентов в списке покупок
+        с раздельным учётом единиц измерения.
+        '''
+        other_unit = Ingredient.objects.create(
+            name=self.INGREDIENT.name,
+            measurement_unit='Other unit'
+        )
+        recipe = Recipe.objects.create(
+            author=self.USER,
+            name='Test shop',
+            image='Test image',
+            text='Test text',
+            cooking_time=COOKING_TIME
+        )
+        IngredientRecipe.objects.create(
+            ingredient=self.INGREDIENT, recipe=recipe, amount=1
+        )
+        IngredientRecipe.objects.create(
+            ingredient=other_unit, recipe=recipe, amount=2
+        )
+        ShoppingList.objects.create(user=self.USER, recipe=self.RECIPE)
+        ShoppingList.objects.create(user=self.USER, recipe=recipe)
+        response = self.auth_client.get(
+            '/api/recipes/download_shopping_cart/'
+        )
+        rows = b''.join(
+            response.streaming_content
+        ).decode('utf-8').splitlines()
+        self.assertEqual(rows[1:], [
+            '1,Test ingredient,Other unit,2',
+            f'2,Test ingredient,Test unit,{AMOUNT_INGREDIENT + 1}',
+        ])
+
+    def count_list_queries(self, client, limit):
+        '''Подсчёт запросов к базе при получении страницы рецептов.'''
+        url = f'{self.URL_DICT["recipe-list"]}?limit={limit}'
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), limit)
+        return len(context)
+
+    def test_recipe_list_constant_queries(self):
+        '''
+        Тест постоянного количества запросов к базе
+        при получении списка рецептов любого размера.
+        '''
+        for number in range(5):
+            recipe = Recipe.objects.create(
+                author=self.NOTAUTHOR,
+                name=f'Test list {number}',
+                image='Test image',
+                text='Test text',
+                cooking_time=COOKING_TIME
+            )
+            recipe.tags.add(self.TAG)
+            IngredientRecipe.objects.create(
+                ingredient=self.INGREDIENT,
+                recipe=recipe,
+                amount=AMOUNT_INGREDIENT
+            )
+            Favourites.objects.create(user=self.USER, recipe=recipe)
+        for client in (self.guest_client, self.auth_client):
+            with self.subTest(client=client):
+                self.assertEqual(
+                    self.count_list_queries(client, 1),
+                    self.count_list_queries(client, 6)
+                )
+        response = self.auth_client.get(self.URL_DICT['recipe-list'])
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+        self.assertFalse(response.data['results'][0]['is_in_shopping_cart'])
+
+    def test_recipe_list_cache(self):
+        '''
+        Тест получения списка и страницы рецепта из кэша
+        с подстановкой флагов текущего пользователя.
+        '''
+        url = self.URL_DICT['recipe-list']
+        detail_url = self.URL_DICT['recipe-detail']
+        expected = self.auth_client.get(url).data
+        self.assertFalse(expected['results'][0]['is_favorited'])
+        for adress in (url, detail_url):
+            with self.subTest(adress=adress):
+                self.guest_client.get(adress)
+                with CaptureQueriesContext(connection) as context:
+                    response = self.guest_client.get(adress)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(len(context), 0)
+        self.auth_client.post(f'{detail_url}favorite/')
+        with CaptureQueriesContext(connection) as context:
+            response = self.auth_client.get(url)
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+        self.assertFalse(self.guest_client.get(url).data['results'][0][
+            'is_favorited'
+        ])
+        self.assertFalse(any(
+            'recipes_recipe' in query['sql'].split('WHERE')[0]
+            for query in context.captured_queries
+        ))
+        Recipe.objects.create(
+            author=self.USER,
+            name='Second recipe',
+            image='Test image',
+            text='Test text',
+            cooking_time=COOKING_TIME
+        )
+        for host in ('backend:8000', 'foodgram.ru'):
+            with self.subTest(host=host):
+                response = self.guest_client.get(
+                    f'{url}?limit=1', HTTP_HOST=host
+                )
+                self.assertTrue(response.data['results'][0][
+                    'image'
+                ].startswith(f'http://{host}/'))
+                self.assertTrue(
+                    response.data['next'].startswith(f'http://{host}/')
+                )
+        self.RECIPE.tags.clear()
+        response = self.guest_client.get(detail_url)
+        self.assertEqual(response.data['tags'], [])
+        self.assertEqual(
+            self.guest_client.get('/api/recipes/0/').status_code,
+            status.HTTP_404_NOT_FOUND
+        )
+
+    def test_favourites_and_recipes_counters(self):
+        '''
+        Тест обновления счётчиков избранного и рецептов автора
+        и их сверки командой recount_counters.
+        '''
+        url = f'{self.URL_DICT["recipe-detail"]}favorite/'
+        self.auth_client.post(url)
+        self.notauthor_client.post(url)
+        self.RECIPE.refresh_from_db()
+        self.assertEqual(self.RECIPE.favourites_count, 2)
+        self.notauthor_client.delete(url)
+        self.RECIPE.refresh_from_db()
+        self.assertEqual(self.RECIPE.favourites_count, 1)
+        response = self.guest_client.get(
+            f'{self.URL_DICT["recipe-list"]}?min_favourites=1'
+        )
+        self.assertEqual(response.data['count'], 1)
+        recipes_count = CustomUser.objects.get(pk=self.USER.pk).recipes_count
+        self.auth_client.post(
+            self.URL_DICT['recipe-list'],
+            data=self.CREATE_RECIPE_DICT,
+            format='json'
+        )
+        self.assertEqual(
+            CustomUser.objects.get(pk=self.USER.pk).recipes_count,
+            recipes_count + 1
+        )
+        Recipe.objects.update(favourites_count=10)
+        call_command('recount_counters', stdout=StringIO())
+        self.RECIPE.refresh_from_db()
+        self.assertEqual(self.RECIPE.favourites_count, 1)
+
+    def test_favourites_ordering_cache_url(self):
+        '''
+        Тест смены порядка и ETag списка рецептов с сортировкой
+        по счётчику избранного после добавления в избранное
+        другим пользователем.
+        '''
+        recipe = Recipe.objects.create(
+            author=self.USER,
+            name='Second recipe',
+            image='Test image',
+            text='Test text',
+            cooking_time=COOKING_TIME
+        )
+        Favourites.objects.create(user=self.USER, recipe=recipe)
+        url = f'{self.URL_DICT["recipe-list"]}?ordering=-favourites_count'
+        response = self.guest_client.get(url)
+        self.assertEqual(
+            [item['id'] for item in response.data['results']][:2],
+            [recipe.id, self.RECIPE.id]
+        )
+        etag = response['ETag']
+        favorite_url = f'{self.URL_DICT["recipe-detail"]}favorite/'
+        self.auth_client.post(favorite_url)
+        self.notauthor_client.post(favorite_url)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['id'] for item in response.data['results']][:2],
+            [self.RECIPE.id, recipe.id]
+        )
+        response = self.guest_client.get(
+            f'{self.URL_DICT["recipe-list"]}?min_favourites=2'
+        )
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [self.RECIPE.id]
+        )
+
+    def test_ingredient_search_url(self):
+        '''
+        Тест поиска ингредиентов по индексу в памяти:
+        сначала совпадения по началу названия, затем по вхождению,
+        без учёта регистра и различий е/ё.
+        '''
+        for name in ('Фасоль', 'соль морская', 'Соль', 'Ёрш', 'Ерш'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+        url = self.URL_DICT['ingredient-list']
+        response = self.guest_client.get(url, {'name': 'СОЛЬ'})
+        self.assertEqual(
+            [item['name'] for item in response.data],
+            ['Соль', 'соль морская', 'Фасоль']
+        )
+        with CaptureQueriesContext(connection) as context:
+            response = self.guest_client.get(url, {'name': 'ерш'})
+        self.assertEqual(len(context), 0)
+        self.assertEqual(len(response.data), 2)
+        Ingredient.objects.create(name='Солод', measurement_unit='г')
+        response = self.guest_client.get(url, {'name': 'сол'})
+        self.assertIn('Солод', [item['name'] for item in response.data])
+        with self.settings(INGREDIENT_SEARCH_LIMIT=1):
+            response = self.guest_client.get(url, {'name': 'соль'})
+        self.assertEqual(len(response.data), 1)
+
+    def test_ingredient_search_other_process_url(self):
+        '''
+        Тест перестройки индекса ингредиентов после загрузки
+        в другом процессе (команда управления): версия в базе меняется,
+        значение в кэше процесса истекает.
+        '''
+        url = self.URL_DICT['ingredient-list']
+        response = self.guest_client.get(url, {'name': 'zzqq'})
+        self.assertEqual(response.data, [])
+        etag = response['ETag']
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='zzqq', measurement_unit='г')]
+        )
+        DataVersion.objects.bump(INGREDIENTS_VERSION)
+        cache.clear()
+        response = self.guest_client.get(
+            url, {'name': 'zzqq'}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data], ['zzqq'])
+
+    def test_conditional_get_url(self):
+        '''
+        Тест ответа 304 на повторный запрос с If-None-Match,
+        если данные не изменились.
+        '''
+        for adress in self.URL_DICT.values():
+            with self.subTest(adress=adress):
+                response = self.auth_client.get(adress)
+                etag = response['ETag']
+                with CaptureQueriesContext(connection) as context:
+                    response = self.auth_client.get(
+                        adress, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(
+                    response.status_code, status.HTTP_304_NOT_MODIFIED
+                )
+                self.assertEqual(len(context), 0)
+                response = self.guest_client.get(
+                    adress, HTTP_IF_NONE_MATCH=etag
+                )
+                if 'recipes/' in adress:
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = self.auth_client.get(self.URL_DICT['recipe-list'])['ETag']
+        self.auth_client.post(
+            f'{self.URL_DICT["recipe-detail"]}shopping_cart/'
+        )
+        response = self.auth_client.get(
+            self.URL_DICT['recipe-list'], HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['results'][0]['is_in_shopping_cart'])
+        etag = self.guest_client.get(self.URL_DICT['tag-list'])['ETag']
+        Tag.objects.create(name='New tag', color='#000', slug='new')
+        response = self.guest_client.get(
+            self.URL_DICT['tag-list'], HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(len(response.data), 2)
+
+    def test_conditional_get_shared_version_url(self):
+        '''
+        Тест смены ETag после изменения версии в базе другим процессом
+        (воркером или командой управления) и ответа 304 на
+        If-None-Match: * только для существующего объекта.
+        '''
+        url = self.URL_DICT['tag-list']
+        etag = self.guest_client.get(url)['ETag']
+        Tag.objects.bulk_create(
+            [Tag(name='New tag', color='#000', slug='new')]
+        )
+        DataVersion.objects.bump(TAGS_VERSION)
+        cache.clear()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        response = self.guest_client.get(
+            self.URL_DICT['tag-detail'], HTTP_IF_NONE_MATCH='*'
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.guest_client.get(
+            reverse('recipes:tag-detail', kwargs={'pk': 0}),
+            HTTP_IF_NONE_MATCH='*'
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_recipe_list_cursor_pagination(self):
+        '''
+        Тест постраничного вывода рецептов по курсору:
+        все рецепты выводятся без повторов в порядке сортировки,
+        без подсчёта общего количества записей.
+        '''
+        for number in range(6):
+            Recipe.objects.create(
+                author=self.USER,
+                name=f'Test cursor {number % 3}',
+                image='Test image',
+                text='Test text',
+                cooking_time=COOKING_TIME
+            )
+        Recipe.objects.update(pub_date=Recipe.objects.first().pub_date)
+        url = self.URL_DICT['recipe-list']
+        expected = [
+            recipe['id'] for recipe in
+            self.guest_client.get(f'{url}?limit=100').data['results']
+        ]
+        received = []
+        pages = []
+        next_url = f'{url}?limit=2&cursor='
+        while next_url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.guest_client.get(next_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            self.assertFalse(any(
+                'COUNT(' in query['sql'] for query in context.captured_queries
+            ))
+            pages.append(response.data)
+            received += [recipe['id'] for recipe in response.data['results']]
+            next_url = response.data['next']
+        self.assertEqual(received, expected)
+        previous = self.guest_client.get(pages[-1]['previous'])
+        self.assertEqual(previous.data['results'], pages[-2]['results'])
+        response = self.guest_client.get(f'{url}?cursor=invalid')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_shoppinglist_totals_url(self):
+        '''
+        Тест обновления итогов списка покупок при добавлении
+        и удалении рецепта и при изменении ингредиентов рецепта.
+        '''
+        url = '/api/recipes/shopping_cart_totals/'
+        cart_url = f'{self.URL_DICT["recipe-detail"]}shopping_cart/'
+        self.auth_client.post(cart_url)
+        self.notauthor_client.post(cart_url)
+        response = self.auth_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{
+            'id': self.INGREDIENT.id,
+            'name': self.INGREDIENT.name,
+            'measurement_unit': self.INGREDIENT.measurement_unit,
+            'amount': AMOUNT_INGREDIENT,
+        }])
+        new_ingredient = Ingredient.objects.create(
+            name='New ingredient', measurement_unit='Test unit'
+        )
+        patch_recipe_dict = dict(self.CREATE_RECIPE_DICT, ingredients=[
+            {'id': self.INGREDIENT.id, 'amount': 2},
+            {'id': new_ingredient.id, 'amount': 3},
+        ])
+        self.auth_client.patch(
+            self.URL_DICT['recipe-detail'],
+            data=patch_recipe_dict,
+            format='json'
+        )
+        for client in (self.auth_client, self.notauthor_client):
+            with self.subTest(client=client):
+                response = client.get(url)
+                self.assertEqual(
+                    [(item['name'], item['amount']) for item in response.data],
+                    [('New ingredient', 3), ('Test ingredient', 2)]
+                )
+        self.auth_client.delete(cart_url)
+        self.assertEqual(self.auth_client.get(url).data, [])
+        self.assertEqual(len(self.notauthor_client.get(url).data), 2)
+        self.RECIPE.delete()
+        self.assertEqual(self.notauthor_client.get(url).data, [])
+
+    def test_shoppinglist_totals_existing_row(self):
+        '''
+        Тест добавления рецепта, когда итог по ингредиенту уже создан
+        другим запросом: количество суммируется без ошибки.
+        '''
+        ShoppingListTotal.objects.create(
+            user=self.USER, ingredient=self.INGREDIENT, amount=5
+        )
+        response = self.auth_client.post(
+            f'{self.URL_DICT["recipe-detail"]}shopping_cart/'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            ShoppingListTotal.objects.get(user=self.USER).amount,
+            5 + AMOUNT_INGREDIENT
+        )
+
+    def test_shoppinglist_totals_orm_changes(self):
+        '''
+        Тест пересчёта итогов при изменении ингредиентов рецепта
+        вне API (админка, ORM) и при удалении рецепта из списков.
+        '''
+        recipe = Recipe.objects.create(
+            author=self.USER,
+            name='Totals recipe',
+            image='Test image',
+            text='Test text',
+            cooking_time=COOKING_TIME
+        )
+        other = Ingredient.objects.create(name='Other', measurement_unit='г')
+        row = IngredientRecipe.objects.create(
+            ingredient=self.INGREDIENT, recipe=recipe, amount=2
+        )
+        for user in (self.USER, self.NOTAUTHOR):
+            ShoppingList.objects.create(user=user, recipe=recipe)
+
+        def totals():
+            return dict(ShoppingListTotal.objects.filter(
+                user=self.NOTAUTHOR
+            ).values_list('ingredient__name', 'amount'))
+
+        self.assertEqual(totals(), {self.INGREDIENT.name: 2})
+        IngredientRecipe.objects.create(
+            ingredient=other, recipe=recipe, amount=4
+        )
+        row.amount = 5
+        row.save()
+        self.assertEqual(totals(), {self.INGREDIENT.name: 5, 'Other': 4})
+        row = IngredientRecipe.objects.get(pk=row.pk)
+        row.ingredient = Ingredient.objects.create(
+            name='Third', measurement_unit='г'
+        )
+        row.amount = 1
+        row.save()
+        self.assertEqual(totals(), {'Other': 4, 'Third': 1})
+        row.delete()
+        self.assertEqual(totals(), {'Other': 4})
+        kept = Recipe.objects.create(
+            author=self.USER,
+            name='Kept recipe',
+            image='Test image',
+            text='Test text',
+            cooking_time=COOKING_TIME
+        )
+        IngredientRecipe.objects.create(
+            ingredient=other, recipe=kept, amount=3
+        )
+        ShoppingList.objects.create(user=self.NOTAUTHOR, recipe=kept)
+        recipe.delete()
+        self.assertEqual(totals(), {'Other': 3})
+
     def test_guest_post_not_acsess_url(self):
         '''
         Тест отсутствия доступа к
@@ -1,48 +1,114 @@
 import csv
+from itertools import chain
 
-from django.http import HttpResponse
+from django.contrib.auth.models import AnonymousUser
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
 from rest_framework import permissions, status
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
-from users.pagination import CustomLimitPaginator
+from users.pagination import CustomKeysetPaginator, CustomLimitPaginator
 
+from . import cache, counters, signals
 from .filters import RecipeFilter, SearchIngredientName
-from .models import (Favourites, Ingredient, IngredientRecipe, Recipe,
-                     ShoppingList, Tag)
+from .ingredient_index import ingredient_index
+from .mixins import ConditionalGetMixin, SharedCacheMixin
+from .models import (Favourites, Ingredient, Recipe, ShoppingList,
+                     ShoppingListTotal, Tag)
+from .parsers import RecipeMultiPartParser
 from .permissions import AuthorOrAuthOrRead
 from .serializers import (FavouritesSerializer, IngredientSerializer,
+                          RecipeIdsOrAllSerializer, RecipeIdsSerializer,
                           RecipeListSerializer, RecipeSerializer,
-                          ShoppingListSerializer, TagSerializer)
+                          ShoppingListSerializer, ShoppingListTotalSerializer,
+                          TagSerializer)
 
 ERROR_MESSAGE_NOT_RECIPE = 'errors: Такого рецепта не существует'
 ERROR_MESSAGE_FAVOR_EXISTS = 'errors: Рецепт уже добавлен в избранное'
 ERROR_MESSAGE_NO_FAVOR = 'errors: Данного рецепта нет в избранном'
 ERROR_MESSAGE_SHOP_EXISTS = 'errors: Рецепт уже добавлен  в список'
 ERROR_MESSAGE_NO_SHOP_CART = 'errors: Данного рецепта нет в списке покупок'
+STATUS_ADDED = 'added'
+STATUS_EXISTS = 'exists'
+STATUS_REMOVED = 'removed'
+STATUS_MISSING = 'missing'
+STATUS_NOT_FOUND = 'not_found'
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class EchoBuffer:
+    def write(self, value):
+        return value
+
+
+class TagViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = [AllowAny]
+    etag_versions = (cache.TAGS_VERSION,)
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     permission_classes = [AllowAny]
     filterset_class = SearchIngredientName
+    etag_versions = (cache.INGREDIENTS_VERSION,)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            self.search, request, *args, **kwargs
+        )
 
+    def search(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return Response(ingredient_index.all())
 
-class RecipeViewSet(ModelViewSet):
+
+class RecipeViewSet(ConditionalGetMixin, SharedCacheMixin, ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = [AuthorOrAuthOrRead]
     filterset_class = RecipeFilter
     pagination_class = CustomLimitPaginator
+    parser_classes = (JSONParser, RecipeMultiPartParser)
+    etag_versions = (cache.RECIPES_VERSION,)
+    etag_per_user = True
+    page_fields = ('id', 'pub_date', 'name')
+
+    def get_counter_versions(self, versions, request):
+        if RecipeFilter.uses_counters(request.query_params):
+            return (*versions, cache.COUNTERS_VERSION)
+        return versions
+
+    def get_etag_versions(self, request):
+        return self.get_counter_versions(self.etag_versions, request)
+
+    def get_page_versions(self, request):
+        return self.get_counter_versions(self.page_versions, request)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve']:
+            return queryset.with_related().with_user_flags(self.request.user)
+        return queryset
+
+    def serialize_shared(self, ids):
+        queryset = Recipe.objects.filter(
+            id__in=ids
+        ).with_related().with_user_flags(AnonymousUser())
+        context = {
+            'request': self.request,
+            'format': self.format_kwarg,
+            'view': self,
+            'subscriptions': set(),
+        }
+        return RecipeListSerializer(queryset, many=True, context=context).data
 
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
@@ -51,45 +117,113 @@ class RecipeViewSet(ModelViewSet):
 
     @staticmethod
     def create_method(request, pk, model, message_exist, serializer):
-        if not Recipe.objects.filter(id=pk).exists():
+        recipe = Recipe.objects.filter(id=pk).first()
+        if recipe is None:
             return Response(
                 ERROR_MESSAGE_NOT_RECIPE,
                 status=status.HTTP_400_BAD_REQUEST
             )
-        data = {'user': request.user.id, 'recipe': pk}
-        if model.objects.filter(**data).exists():
+        try:
+            with transaction.atomic():
+                obj = model.objects.create(user=request.user, recipe=recipe)
+        except IntegrityError:
+            # Ошибка может возникнуть и в обработчиках сигналов: ответ
+            # «уже добавлен» только если запись (user, recipe) есть.
+            if not model.objects.filter(
+                user=request.user, recipe=recipe
+            ).exists():
+                raise
             return Response(
                 message_exist,
                 status=status.HTTP_400_BAD_REQUEST
             )
         context = {'request': request}
-        serializer = serializer(data=data, context=context)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            serializer(obj, context=context).data,
+            status=status.HTTP_201_CREATED
+        )
 
     @staticmethod
     def delete_method(request, pk, model, message):
-        user = request.user
+        deleted, _ = model.objects.filter(
+            user=request.user,
+            recipe_id=pk
+        ).delete()
+        if deleted:
+            return Response(status=status.HTTP_204_NO_CONTENT)
         if not Recipe.objects.filter(id=pk).exists():
             return Response(
                 ERROR_MESSAGE_NOT_RECIPE,
                 status=status.HTTP_400_BAD_REQUEST
             )
-        recipe = Recipe.objects.get(id=pk)
-        obj = model.objects.filter(
-            user=user,
-            recipe=recipe
-        )
-        if obj.exists():
-            obj.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             message,
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    @staticmethod
+    def bulk_changed(model, user_id, recipe_ids, added):
+        '''
+        Массовые вставка и удаление не вызывают сигналы, поэтому
+        счётчики, итоги списка покупок и кэш обновляются здесь.
+        '''
+        if model is Favourites:
+            change = counters.increment_many if added else (
+                counters.decrement_many
+            )
+            change(Recipe, recipe_ids, 'favourites_count')
+            cache.invalidate_counters()
+        elif added:
+            ShoppingListTotal.objects.add_recipes(user_id, recipe_ids)
+        else:
+            ShoppingListTotal.objects.remove_recipes(user_id, recipe_ids)
+        cache.invalidate_user(user_id)
+
+    def batch_create_method(self, request, model):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['recipes']
+        found = set(Recipe.objects.filter(
+            id__in=ids
+        ).values_list('id', flat=True))
+        with transaction.atomic():
+            added = model.objects.add_missing(
+                request.user.id, [pk for pk in ids if pk in found]
+            )
+            if added:
+                self.bulk_changed(model, request.user.id, added, True)
+        statuses = dict.fromkeys(found, STATUS_EXISTS)
+        statuses.update(dict.fromkeys(added, STATUS_ADDED))
+        return Response({'results': [
+            {'id': pk, 'status': statuses.get(pk, STATUS_NOT_FOUND)}
+            for pk in ids
+        ]})
+
+    def batch_delete_method(self, request, model):
+        serializer = RecipeIdsOrAllSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data.get('recipes')
+        objects = model.objects.filter(user=request.user)
+        if ids is not None:
+            objects = objects.filter(recipe_id__in=ids)
+        with transaction.atomic():
+            removed = list(objects.select_for_update().values_list(
+                'recipe_id', flat=True
+            ))
+            if removed:
+                with signals.bulk_change():
+                    objects.delete()
+                self.bulk_changed(model, request.user.id, removed, False)
+        if ids is None:
+            ids = removed
+        removed = set(removed)
+        return Response({'results': [
+            {'id': pk, 'status': (
+                STATUS_REMOVED if pk in removed else STATUS_MISSING
+            )}
+            for pk in ids
+        ]})
+
     @action(
         detail=True,
         methods=['post'],
@@ -114,44 +248,63 @@ class RecipeViewSet(ModelViewSet):
             ERROR_MESSAGE_NO_FAVOR
         )
 
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+        pagination_class=CustomKeysetPaginator
+    )
+    def feed(self, request):
+        user = request.user
+        queryset = self.filter_queryset(
+            Recipe.objects.feed(user).with_related().with_user_flags(user)
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = RecipeListSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=False,
         methods=['get'],
         permission_classes=[IsAuthenticated]
     )
     def download_shopping_cart(self, request):
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__shoppinglist__user=request.user
+        ingredients = ShoppingListTotal.objects.filter(
+            user=request.user
+        ).order_by(
+            'ingredient__name', 'ingredient__measurement_unit'
         ).values_list(
-            'ingredient__name',
-            'ingredient__measurement_unit',
-            'amount'
-        )
-        shoplist = {}
-        for ingredient in ingredients:
-            if ingredient[0] in shoplist:
-                shoplist[ingredient[0]]['amount'] += ingredient[2]
-            else:
-                shoplist[ingredient[0]] = {
-                    'measurement_unit': ingredient[1],
-                    'amount': ingredient[2]
-                }
-        response = HttpResponse(
-            content_type='text/csv',
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
         )
-        writer = csv.writer(response)
-        writer.writerow(['number', 'name', 'measurement_unit', 'amount'])
-        number = 1
-        for name, meas_amount in shoplist.items():
-            writer.writerow(
-                [
-                    f'{number}', f'{name}',
-                    f'{meas_amount["measurement_unit"]}',
-                    f'{meas_amount["amount"]}'
-                ]
+        writer = csv.writer(EchoBuffer())
+        rows = (
+            writer.writerow([f'{number}', f'{name}', f'{unit}', f'{total}'])
+            for number, (name, unit, total) in enumerate(
+                ingredients.iterator(), start=1
             )
-            number += 1
-        return response
+        )
+        header = writer.writerow(
+            ['number', 'name', 'measurement_unit', 'amount']
+        )
+        return StreamingHttpResponse(
+            chain([header], rows),
+            content_type='text/csv'
+        )
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_cart_totals(self, request):
+        totals = ShoppingListTotal.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by(
+            'ingredient__name', 'ingredient__measurement_unit'
+        )
+        return Response(ShoppingListTotalSerializer(totals, many=True).data)
 
     @action(
         detail=True,
@@ -176,3 +329,31 @@ class RecipeViewSet(ModelViewSet):
             ShoppingList,
             ERROR_MESSAGE_NO_SHOP_CART
         )
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='shopping_cart',
+        url_name='shopping-cart-batch',
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch_create_method(request, ShoppingList)
+
+    @shopping_cart_batch.mapping.delete
+    def delete_shopping_cart_batch(self, request):
+        return self.batch_delete_method(request, ShoppingList)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='favorite',
+        url_name='favorite-batch',
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def favorite_batch(self, request):
+        return self.batch_create_method(request, Favourites)
+
+    @favorite_batch.mapping.delete
+    def delete_favorite_batch(self, request):
+        return self.batch_delete_method(request, Favourites)
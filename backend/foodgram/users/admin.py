@@ -12,7 +12,7 @@ class UserAdmin(UserAdmin):
     model = CustomUser
     list_display = (
         'id', 'email', 'username', 'first_name', 'last_name', 'is_blocked',
-        'is_superuser',
+        'is_superuser', 'recipes_count', 'followers_count',
     )
     list_filter = (
         'email', 'username', 'is_blocked', 'is_superuser',
@@ -21,8 +21,10 @@ class UserAdmin(UserAdmin):
         ('Данные пользователя', {'fields': (
             'email', 'username', 'first_name', 'last_name', 'password',
         )}),
-        ('Права доступа', {'fields': ('is_blocked', 'is_superuser',)})
+        ('Права доступа', {'fields': ('is_blocked', 'is_superuser',)}),
+        ('Статистика', {'fields': ('recipes_count', 'followers_count',)})
     )
+    readonly_fields = ('recipes_count', 'followers_count')
     add_fieldsets = (
         (None, {
             'classes': ('wide',),
@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import CustomUser
+
+# Счётчики меняются запросами update() в обход сохранения модели:
+# в снимок пользователя они не входят и при save() не перезаписываются.
+EXCLUDED_FIELDS = ('recipes_count', 'followers_count')
+USER_FIELDS = tuple(
+    field.attname for field in CustomUser._meta.concrete_fields
+    if field.attname not in EXCLUDED_FIELDS
+)
+TOKEN_FIELDS = ('key', 'user_id', 'created')
+
+stats = {'hits': 0, 'misses': 0}
+
+
+class TokenCache:
+    '''
+    Ограниченный по размеру LRU-кэш токенов со сроком жизни записей.
+    Кэш хранится в памяти процесса: изменения, сделанные в других
+    процессах, становятся видны не позже чем через timeout секунд.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.user_keys = {}
+
+    def get_max_size(self):
+        return getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000)
+
+    def get_timeout(self):
+        return getattr(settings, 'AUTH_TOKEN_CACHE_TIMEOUT', 60)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            stats['hits'] += 1
+            return entry[1]
+
+    def set(self, key, user_id, snapshot):
+        with self.lock:
+            self.discard(key)
+            self.entries[key] = (
+                time.monotonic() + self.get_timeout(), snapshot, user_id
+            )
+            self.user_keys.setdefault(user_id, set()).add(key)
+            while len(self.entries) > self.get_max_size():
+                self.discard(next(iter(self.entries)))
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self.user_keys.get(entry[2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.user_keys[entry[2]]
+
+    def invalidate(self, key):
+        with self.lock:
+            self.discard(key)
+
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for key in self.user_keys.pop(user_id, ()):
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.user_keys.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+token_cache = TokenCache()
+
+
+def on_commit_repeat(function, *args):
+    '''
+    Сброс сразу и повторно после фиксации транзакции: иначе данные,
+    прочитанные до фиксации, снова попадут в кэш.
+    '''
+    function(*args)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: function(*args))
+
+
+def invalidate_token(key):
+    on_commit_repeat(token_cache.invalidate, key)
+
+
+def invalidate_user(user_id):
+    on_commit_repeat(token_cache.invalidate_user, user_id)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    Аутентификация по токену с кэшированием снимка пользователя:
+    для повторных запросов с тем же токеном обращение к базе
+    не выполняется. Для каждого запроса создаются новые объекты
+    пользователя и токена.
+    '''
+
+    def load_snapshot(self, key):
+        row = Token.objects.filter(key=key).values_list(
+            *TOKEN_FIELDS, *(f'user__{name}' for name in USER_FIELDS)
+        ).first()
+        if row is None:
+            return None
+        return row[:len(TOKEN_FIELDS)], row[len(TOKEN_FIELDS):]
+
+    def authenticate_credentials(self, key):
+        snapshot = token_cache.get(key)
+        if snapshot is None:
+            snapshot = self.load_snapshot(key)
+            if snapshot is None:
+                raise AuthenticationFailed(_('Invalid token.'))
+            token_cache.set(key, snapshot[0][1], snapshot)
+        token_values, user_values = snapshot
+        user = CustomUser.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, user_values)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        token = Token.from_db(DEFAULT_DB_ALIAS, TOKEN_FIELDS, token_values)
+        token.user = user
+        return user, token
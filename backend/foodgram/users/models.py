@@ -21,6 +21,16 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     date_joined = models.DateTimeField(default=timezone.now)
     is_blocked = models.BooleanField('Заблокирован', default=False)
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        db_index=True
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        db_index=True
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -6,5 +6,6 @@ from .models import CustomUser
 class IsBlockPermission(BasePermission):
     def has_permission(self, request, view):
         email = request.data.get('email')
-        user = CustomUser.objects.filter(email=email)
-        return not user[0].is_blocked
+        return not CustomUser.objects.filter(
+            email=email, is_blocked=True
+        ).exists()
@@ -6,6 +6,31 @@ from rest_framework import serializers
 from .models import CustomUser, SubscribeModel
 
 
+def get_recipes_limit(request):
+    try:
+        recipes_limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return None
+    return recipes_limit if recipes_limit >= 0 else None
+
+
+def get_subscriptions(context):
+    '''
+    ID авторов, на которых подписан пользователь запроса. Загружаются
+    одним запросом и сохраняются в общем контексте сериализаторов.
+    '''
+    subscriptions = context.get('subscriptions')
+    if subscriptions is None:
+        user = context['request'].user
+        subscriptions = set()
+        if user.is_authenticated:
+            subscriptions = set(SubscribeModel.objects.filter(
+                follower=user
+            ).values_list('author_id', flat=True))
+        context['subscriptions'] = subscriptions
+    return subscriptions
+
+
 class CustomUserCreateSerializer(UserSerializer):
 
     class Meta:
@@ -44,11 +69,7 @@ class CustomUserSerializer(UserSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return SubscribeModel.objects.filter(
-            author=obj.id, follower=user).exists()
+        return obj.id in get_subscriptions(self.context)
 
     def create(self, validated_data):
         validated_data['password'] = (
@@ -75,12 +96,15 @@ class SubscribeSerializer(CustomUserSerializer):
         )
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes = obj.recipes.all()
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
+        recipes = self.context.get('recipes')
+        if recipes is not None:
+            recipes = recipes.get(obj.id, [])
+        else:
+            recipes = obj.recipes.all()
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         return BaseRecipeDataSerializer(recipes, many=True).data
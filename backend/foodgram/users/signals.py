@@ -0,0 +1,28 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes import counters
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token, invalidate_user
+from .models import CustomUser, SubscribeModel
+
+
+@receiver(post_save, sender=SubscribeModel)
+def subscribe_created(instance, created, **kwargs):
+    if created:
+        counters.increment(CustomUser, instance.author_id, 'followers_count')
+
+
+@receiver(post_delete, sender=SubscribeModel)
+def subscribe_deleted(instance, **kwargs):
+    counters.decrement(CustomUser, instance.author_id, 'followers_count')
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(instance, **kwargs):
+    invalidate_user(instance.id)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    invalidate_token(instance.key)
@@ -1,7 +1,11 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from recipes.models import Recipe
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient, APITestCase
+from users.authentication import stats, token_cache
 from users.models import CustomUser, SubscribeModel
 
 CREATE_USER_DICT = dict(
@@ -176,6 +180,115 @@ class TestRecipeURL(APITestCase):
         response = self.auth_client.post(url, data=data, format='json')
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+    def get_token_client(self):
+        '''Клиент дополнительного пользователя с токеном.'''
+        self.create_another_user()
+        key = self.create_token().data['auth_token']
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + key)
+        return client, key
+
+    def test_cached_token_auth_url(self):
+        '''
+        Тест кэширования токена: повторный запрос выполняется
+        без обращения к базе за токеном, после выхода токен
+        перестаёт действовать.
+        '''
+        client, key = self.get_token_client()
+        token_cache.clear()
+        url = self.URL_DICT['user-me']
+        queries = []
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['email'], 'Another@another.ru')
+            queries.append(len(context))
+        self.assertEqual(queries[1], queries[0] - 1)
+        hits = stats['hits']
+        client.get(url)
+        self.assertEqual(stats['hits'], hits + 1)
+        response = client.post(self.URL_DICT['user-logout'])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertNotIn(key, token_cache.entries)
+        response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_cache_invalidated_on_user_change_url(self):
+        '''
+        Тест сброса кэша токенов при смене пароля и блокировке
+        пользователя.
+        '''
+        client, key = self.get_token_client()
+        data = dict(
+            new_password='newpaaword',
+            current_password=CREATE_ANOTHER_USER_DICT['password']
+        )
+        response = client.post(
+            self.URL_DICT['user-setpassword'], data=data, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertNotIn(key, token_cache.entries)
+        client.get(self.URL_DICT['user-me'])
+        self.assertIn(key, token_cache.entries)
+        user = CustomUser.objects.get(email='Another@another.ru')
+        user.is_blocked = True
+        user.save()
+        self.assertNotIn(key, token_cache.entries)
+        user.refresh_from_db()
+        self.assertEqual(user.followers_count, 0)
+
+    def test_users_list_is_subscribed_queries_url(self):
+        '''
+        Тест признака подписки в списке пользователей: число запросов
+        не зависит от размера страницы.
+        '''
+        authors = [
+            CustomUser.objects.create_user(
+                email=f'author{number}@foodgram.ru',
+                username=f'author{number}',
+                first_name='author',
+                last_name='author',
+                password='author'
+            ) for number in range(4)
+        ]
+        SubscribeModel.objects.bulk_create(
+            SubscribeModel(author=author, follower=self.USER)
+            for author in authors[::2]
+        )
+        expected = {author.id: index % 2 == 0
+                    for index, author in enumerate(authors)}
+        url = self.URL_DICT['user-list']
+        queries = []
+        for limit in (1, 5):
+            with CaptureQueriesContext(connection) as context:
+                response = self.auth_client.get(url, {'limit': limit})
+            queries.append(len(context))
+            for user in response.data['results']:
+                self.assertEqual(
+                    user['is_subscribed'], expected.get(user['id'], False)
+                )
+        self.assertEqual(queries[0], queries[1])
+
+    def test_create_token_unknown_email_url(self):
+        '''Тест входа с адресом незарегистрированного пользователя.'''
+        response = self.guest_client.post(
+            self.URL_DICT['user-login'],
+            data=dict(email='unknown@foodgram.ru', password='password'),
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_token_blocked_user_url(self):
+        '''Тест запрета входа заблокированному пользователю.'''
+        self.create_another_user()
+        CustomUser.objects.filter(email='Another@another.ru').update(
+            is_blocked=True
+        )
+        response = self.create_token()
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(Token.objects.exists())
+
     def test_auth_users_me_url(self):
         '''
         Тест доступа пользователя
@@ -215,6 +328,20 @@ class TestRecipeURL(APITestCase):
             count_subscribe - 1
         )
 
+    def test_followers_count_auth_url(self):
+        '''
+        Тест обновления счётчика подписчиков
+        при создании и удалении подписки.
+        '''
+        self.create_subscribe()
+        author = CustomUser.objects.first()
+        self.assertEqual(author.followers_count, 1)
+        self.auth_client.delete(
+            reverse('users:subscribe', kwargs={'id': author.id})
+        )
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 0)
+
     def test_user_subscribes_auth_url(self):
         '''
         Тест просмотра списка подписок
@@ -228,6 +355,37 @@ class TestRecipeURL(APITestCase):
             'Anotheruser'
         )
 
+    def test_user_subscribes_recipes_limit_url(self):
+        '''
+        Тест ограничения количества рецептов каждого автора
+        в списке подписок параметром recipes_limit.
+        '''
+        self.create_subscribe()
+        author = CustomUser.objects.get(username='Anotheruser')
+        for number in range(3):
+            Recipe.objects.create(
+                author=author,
+                name=f'Recipe {number}',
+                image='Test image',
+                text='Test text',
+                cooking_time=1
+            )
+        expected = list(author.recipes.values_list('id', flat=True))
+        for recipes_limit, count in (('2', 2), ('', 3), ('abc', 3)):
+            with self.subTest(recipes_limit=recipes_limit):
+                response = self.auth_client.get(
+                    self.URL_DICT['subscribe-list'],
+                    {'recipes_limit': recipes_limit}
+                )
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                subscription = response.data['results'][0]
+                self.assertTrue(subscription['is_subscribed'])
+                self.assertEqual(subscription['recipes_count'], 3)
+                self.assertEqual(
+                    [recipe['id'] for recipe in subscription['recipes']],
+                    expected[:count]
+                )
+
     def test_guest_users_get_not_acsess_url(self):
         '''
         Тест отсутствия доступа к закрытым адресам
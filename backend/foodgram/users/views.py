@@ -1,4 +1,5 @@
 from django.shortcuts import get_object_or_404
+from recipes.models import Recipe
 from rest_framework import status
 from rest_framework.mixins import (CreateModelMixin, DestroyModelMixin,
                                    ListModelMixin)
@@ -7,7 +8,7 @@ from rest_framework.viewsets import GenericViewSet
 
 from .models import CustomUser, SubscribeModel
 from .pagination import CustomLimitPaginator
-from .serializers import SubscribeSerializer
+from .serializers import SubscribeSerializer, get_recipes_limit
 
 ERROR_MESSAGE_SUBSCRIBE_SELF = 'errors: Нельзя поодписаться на себя'
 ERROR_MESSAGE_SUBSCRIBE_EXISTS = 'errors: Вы уже подписаны на пользователя'
@@ -25,6 +26,20 @@ class SubscribeListViewSet(
     def get_queryset(self):
         return CustomUser.objects.filter(author__follower=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        author_ids = [author.id for author in page]
+        recipes = {author_id: [] for author_id in author_ids}
+        for recipe in Recipe.objects.first_per_author(
+            author_ids, get_recipes_limit(request)
+        ):
+            recipes[recipe.author_id].append(recipe)
+        context = self.get_serializer_context()
+        context['subscriptions'] = set(author_ids)
+        context['recipes'] = recipes
+        serializer = self.serializer_class(page, many=True, context=context)
+        return self.get_paginated_response(serializer.data)
+
 
 class SubscribeViewSet(
     GenericViewSet,